@@ -0,0 +1,203 @@
+'''
+Benchmarks for uhttp against a loopback server, no network needed.
+
+Every request body type and response mode is run across payload sizes. Each case reports requests/sec, latency
+percentiles, payload bytes/sec and the client's peak traced memory. The server runs in its own process so neither its
+CPU time nor its memory is counted.
+
+Usage:
+    python -m benchmarks.bench                          # full run
+    python -m benchmarks.bench --quick                  # fewer sizes and iterations
+    python -m benchmarks.bench --save baseline.json
+    python -m benchmarks.bench --baseline baseline.json --tolerance 0.2
+
+With --baseline the run exits with status 1 if any case lost more than the tolerance in requests/sec, or grew its
+peak memory by more than the tolerance.
+'''
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from uhttp import requests
+
+KIB = 1024
+SIZES = (KIB, 64 * KIB, 1024 * KIB)
+QUICK_SIZES = (KIB, 64 * KIB)
+
+
+class Case:
+    def __init__(self, name: str, size: int, run, session: bool = False):
+        self.name = name
+        self.size = size
+        self.run = run
+        self.session = session
+
+
+def _start_server(port: int):
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.server', str(port)])
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError(f'Benchmark server did not start on port {port}.')
+
+
+def _write_file(directory: str, name: str, size: int) -> str:
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as writer:
+        writer.write(os.urandom(size))
+    return path
+
+
+def build_cases(base_url: str, sizes, directory: str) -> list:
+    sink = base_url + '/sink'
+    cases = []
+    for size in sizes:
+        file_name = _write_file(directory, f'upload{size}.bin', size)
+        text = 'x' * size
+        cases += [
+            Case('body json', size, lambda text=text: requests.post(sink, json={'data': text})),
+            Case('body form', size, lambda text=text: requests.post(sink, data={'data': text})),
+            Case('body file', size, lambda file_name=file_name: requests.post(sink, file=file_name)),
+            Case('body multifile', size, lambda file_name=file_name: requests.HttpRequest(
+                sink, method='POST', body=requests.HttpBodyMultiFile([
+                    requests.HttpBodyMultiFileSection('upload', file_path=file_name),
+                    requests.HttpBodyMultiFileSection('meta', value='{"id": 1}'),
+                ])).response),
+            Case('body chunked', size, lambda file_name=file_name: requests.post(sink, file=file_name, chunked=True,
+                                                                                 chunk_size=4096)),
+            Case('response length', size, lambda size=size: requests.get(f'{base_url}/bytes/{size}')),
+            Case('response chunked', size, lambda size=size: requests.get(f'{base_url}/chunked/{size}')),
+            Case('response save_to_file', size, lambda size=size: requests.get(
+                f'{base_url}/bytes/{size}', save_to_file=os.path.join(directory, 'download.bin'))),
+        ]
+    cases.append(Case('session keep-alive', KIB, None, session=True))
+    return cases
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(case: Case, base_url: str, min_time: float, min_iterations: int) -> dict:
+    session = requests.Session() if case.session else None
+    run = case.run
+    if session is not None:
+        url = f'{base_url}/bytes/{case.size}'
+        run = lambda: session.get(url)
+    try:
+        run()  # Warm up DNS, the TLS and connection caches and the payload on the server
+        latencies = []
+        started = time.perf_counter()
+        while len(latencies) < min_iterations or time.perf_counter() - started < min_time:
+            before = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        for _ in range(3):
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if session is not None:
+            session.close()
+    latencies.sort()
+    return {
+        'case': case.name,
+        'size': case.size,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': _percentile(latencies, 0.5) * 1000,
+        'p90_ms': _percentile(latencies, 0.9) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'mib_per_s': case.size * len(latencies) / elapsed / (1024 * KIB),
+        'peak_kib': peak / KIB,
+    }
+
+
+def format_table(results: list) -> str:
+    lines = ['%-24s %9s %8s %9s %9s %9s %10s %10s' % (
+        'case', 'size', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'MiB/s', 'peak KiB')]
+    for result in results:
+        lines.append('%-24s %9d %8.1f %9.2f %9.2f %9.2f %10.2f %10.1f' % (
+            result['case'], result['size'], result['rps'], result['p50_ms'], result['p90_ms'], result['p99_ms'],
+            result['mib_per_s'], result['peak_kib']))
+    return '\n'.join(lines)
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    previous = {(result['case'], result['size']): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['case'], result['size']))
+        if before is None:
+            continue
+        if result['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{result['case']} {result['size']}: {before['rps']:.1f} -> {result['rps']:.1f} req/s")
+        if result['peak_kib'] > before['peak_kib'] * (1 + tolerance):
+            regressions.append(
+                f"{result['case']} {result['size']}: {before['peak_kib']:.1f} -> {result['peak_kib']:.1f} peak KiB")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=5080)
+    parser.add_argument('--quick', action='store_true', help='smaller payloads and shorter runs')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds to run each case for')
+    parser.add_argument('--min-iterations', type=int, default=20)
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--save', help='write the results as json')
+    parser.add_argument('--report', help='also write the table to this file')
+    parser.add_argument('--baseline', help='json results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.min_time, args.min_iterations = min(args.min_time, 0.2), min(args.min_iterations, 5)
+
+    base_url = f'http://127.0.0.1:{args.port}'
+    server = _start_server(args.port)
+    directory = tempfile.mkdtemp()
+    try:
+        results = []
+        for case in build_cases(base_url, QUICK_SIZES if args.quick else SIZES, directory):
+            if args.filter in case.name:
+                results.append(measure(case, base_url, args.min_time, args.min_iterations))
+                print(format_table(results[-1:]).splitlines()[-1], flush=True)
+    finally:
+        server.kill()
+        server.wait()
+        shutil.rmtree(directory)
+
+    table = format_table(results)
+    print()
+    print(table)
+    if args.report:
+        with open(args.report, 'w') as writer:
+            writer.write(table + '\n')
+    if args.save:
+        with open(args.save, 'w') as writer:
+            json.dump(results, writer, indent=2)
+    if args.baseline:
+        with open(args.baseline) as reader:
+            regressions = compare(results, json.load(reader), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
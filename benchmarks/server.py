@@ -0,0 +1,97 @@
+'''
+Loopback HTTP/1.1 server for the benchmarks, built on raw sockets so its own overhead stays small and predictable.
+
+Routes:
+    /bytes/<n>      n bytes with a Content-Length
+    /chunked/<n>    n bytes with chunked transfer encoding, in 4096 byte chunks
+    anything else   the request body is read and discarded, the reply is 'ok'
+
+Connections are kept alive unless the client sends Connection: close.
+
+Run on its own with:
+    python -m benchmarks.server 5080
+'''
+import socket
+import sys
+from threading import Thread
+
+CHUNK_SIZE = 4096
+_payloads = {}
+
+
+def _payload(size: int) -> bytes:
+    if size not in _payloads:
+        _payloads[size] = bytes(index % 251 for index in range(size))
+    return _payloads[size]
+
+
+def _read_body(reader, headers: dict):
+    if headers.get(b'transfer-encoding', b'').lower() == b'chunked':
+        while True:
+            size = int(reader.readline().split(b';', 1)[0], 16)
+            if not size:
+                while reader.readline() not in (b'\r\n', b''):
+                    pass
+                return
+            reader.read(size + 2)
+    length = int(headers.get(b'content-length', b'0'))
+    while length:
+        length -= len(reader.read(min(length, 65536)))
+
+
+def _respond(sock, path: bytes):
+    parts = path.split(b'/')
+    if len(parts) == 3 and parts[1] == b'bytes':
+        body = _payload(int(parts[2]))
+        sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nContent-Length: %d\r\n\r\n'
+                     % len(body))
+        sock.sendall(body)
+    elif len(parts) == 3 and parts[1] == b'chunked':
+        body = memoryview(_payload(int(parts[2])))
+        sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            sock.sendall(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+        sock.sendall(b'0\r\n\r\n')
+    else:
+        sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nok')
+
+
+def _serve_connection(sock):
+    reader = sock.makefile('rb')
+    try:
+        while True:
+            request_line = reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.partition(b':')
+                headers[name.strip().lower()] = value.strip()
+            _read_body(reader, headers)
+            _respond(sock, request_line.split(b' ')[1])
+            if headers.get(b'connection', b'').lower() == b'close':
+                return
+    except OSError:
+        pass
+    finally:
+        reader.close()
+        sock.close()
+
+
+def serve(port: int):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', port))
+    listener.listen(128)
+    while True:
+        sock, _ = listener.accept()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        Thread(target=_serve_connection, args=(sock,), daemon=True).start()
+
+
+if __name__ == '__main__':
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else 5080)
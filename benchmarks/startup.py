@@ -0,0 +1,57 @@
+'''
+Measures the cost of importing uhttp: wall time and traced memory, each import in a fresh interpreter.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 50 --module uhttp.aio
+'''
+import argparse
+import json
+import subprocess
+import sys
+
+_PROBE = '''
+import json, time, tracemalloc
+tracemalloc.start()
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+current, peak = tracemalloc.get_traced_memory()
+print(json.dumps({{'ms': elapsed * 1000, 'kib': current / 1024, 'peak_kib': peak / 1024}}))
+'''
+
+
+def measure(module: str, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', _PROBE.format(module=module)], capture_output=True, text=True,
+                                check=True).stdout
+        lines = output.splitlines()
+        if len(lines) != 1:
+            raise RuntimeError(f'Importing {module} wrote to stdout: {lines[:-1]}')
+        samples.append(json.loads(lines[0]))
+    times = sorted(sample['ms'] for sample in samples)
+    return {
+        'module': module,
+        'median_ms': times[len(times) // 2],
+        'min_ms': times[0],
+        'kib': samples[-1]['kib'],
+        'peak_kib': samples[-1]['peak_kib'],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--module', action='append', help='module to import, may be repeated')
+    args = parser.parse_args(argv)
+    print('%-20s %10s %10s %10s %10s' % ('import', 'median ms', 'min ms', 'KiB', 'peak KiB'))
+    for module in args.module or ['uhttp.requests', 'uhttp.aio']:
+        result = measure(module, args.runs)
+        print('%-20s %10.2f %10.2f %10.1f %10.1f' % (
+            result['module'], result['median_ms'], result['min_ms'], result['kib'], result['peak_kib']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import base64
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+
+class KeepAliveServer:
+    '''
+    Plain HTTP/1.1 server that honours keep-alive, the flask development server always closes the connection.
+
+    Requests to unregistered paths are echoed back as json.
+    '''
+
+    def __init__(self, port=5001, ssl_context=None):
+        self.port = port
+        self.url = "%s://127.0.0.1:%s" % ('http' if ssl_context is None else 'https', self.port)
+        self.routes = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self._build_handler())
+        self.server.daemon_threads = True
+        if ssl_context is not None:
+            self.server.socket = ssl_context.wrap_socket(self.server.socket, server_side=True)
+
+    def start(self):
+        server_thread = Thread(target=self.server.serve_forever, daemon=True)
+        server_thread.start()
+
+    def add_route(self, url, callback):
+        '''callback(handler, body) returns (status, headers, payload).'''
+        self.routes[url] = callback
+
+    @staticmethod
+    def echo(handler, body):
+        return 200, {'Content-Type': 'application/json'}, json.dumps({
+            'method': handler.command,
+            'path': handler.path,
+            'headers': {key: value for key, value in handler.headers.items()},
+            'port': handler.client_address[1],
+            'data': base64.b64encode(body).decode('ascii'),
+        }).encode()
+
+    def _build_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def handle_request(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                callback = server.routes.get(self.path.split('?')[0], server.echo)
+                status, headers, payload = callback(self, body)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                if 'Content-Length' not in headers and 'Transfer-Encoding' not in headers:
+                    self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = handle_request
+
+        return Handler
+
+
+@pytest.fixture(scope='session')
+def keep_alive_server():
+    server = KeepAliveServer()
+    server.start()
+    yield server
+
+
+@pytest.fixture(scope='session')
+def tls_server():
+    import ssl
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain('tests/static/localhost.crt', 'tests/static/localhost.key')
+    server = KeepAliveServer(port=5443, ssl_context=context)
+    server.start()
+    yield server
+
+
+@pytest.fixture
+def ranged_image(keep_alive_server):
+    '''/image.bin serves state['content'] and honours Range requests while state['ranges'] is set.'''
+    import os
+    import threading
+    import time
+    lock = threading.Lock()
+    state = {'content': os.urandom(1024 * 1024), 'ranges': True, 'chunked': False, 'etag': '"v1"', 'seen': [],
+             'active': 0, 'peak': 0}
+
+    def callback(handler, body):
+        content = state['content']
+        headers = {'ETag': state['etag']}
+        if state['ranges']:
+            headers['Accept-Ranges'] = 'bytes'
+        range_header = handler.headers.get('Range')
+        with lock:
+            state['seen'].append((handler.command, range_header))
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.05)
+        with lock:
+            state['active'] -= 1
+        if state['ranges'] and range_header and handler.headers.get('If-Range') == state['etag']:
+            start, end = (int(position) for position in range_header[6:].split('-'))
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(content))
+            payload = content[start:end + 1]
+            if state['chunked']:
+                headers['Transfer-Encoding'] = 'chunked'
+                payload = b'%x\r\n%s\r\n0\r\n\r\n' % (len(payload), payload)
+            return 206, headers, payload
+        return 200, headers, content
+
+    server = keep_alive_server
+    server.add_route('/image.bin', callback)
+    state['url'] = server.url + '/image.bin'
+    return state
+
+
+@pytest.fixture
+def raw_server():
+    '''
+    Answers each connection with state['response'] as raw bytes after the request head, then closes. For replies the
+    http.server based servers will not send, such as a body cut short or one without any framing.
+    '''
+    import socket
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    state = {'response': b'', 'url': 'http://127.0.0.1:%d' % listener.getsockname()[1]}
+
+    def serve():
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            with sock:
+                reader = sock.makefile('rb')
+                while reader.readline() not in (b'\r\n', b''):
+                    pass
+                reader.close()
+                sock.sendall(state['response'])
+
+    Thread(target=serve, daemon=True).start()
+    yield state
+    listener.close()
@@ -0,0 +1,133 @@
+import asyncio
+import base64
+import json
+import time
+
+import pytest
+
+from uhttp import aio
+
+
+@pytest.fixture(scope='session')
+def aio_routes(keep_alive_server):
+    def slow(handler, body):
+        time.sleep(0.3)
+        return 200, {}, b'slow'
+
+    keep_alive_server.add_route('/aio_slow', slow)
+    keep_alive_server.add_route('/aio_chunked', lambda handler, body: (
+        200, {'Transfer-Encoding': 'chunked'}, b'5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: yes\r\n\r\n'))
+    keep_alive_server.add_route('/aio_no_content', lambda handler, body: (204, {}, b''))
+    return keep_alive_server
+
+
+def test_get(aio_routes):
+    r = asyncio.run(aio.get(aio_routes.url + '/echo'))
+    assert r.status_code == '200'
+    assert r.json['method'] == 'GET'
+    assert r.json['headers']['Connection'] == 'close'
+
+
+def test_post_json(aio_routes):
+    r = asyncio.run(aio.post(aio_routes.url + '/echo', json={'temperature': 21.5}))
+    assert r.json['headers']['Content-Type'] == 'application/json'
+    assert json.loads(base64.b64decode(r.json['data'])) == {'temperature': 21.5}
+
+
+def test_post_file_chunked(aio_routes, tmp_path):
+    file_name = str(tmp_path / 'log.txt')
+    with open(file_name, 'wb') as writer:
+        writer.write(b'line\n' * 1000)
+    r = asyncio.run(aio.post(aio_routes.url + '/echo', file=file_name))
+    assert base64.b64decode(r.json['data']) == b'line\n' * 1000
+
+
+def test_chunked_response(aio_routes):
+    r = asyncio.run(aio.get(aio_routes.url + '/aio_chunked'))
+    assert r.text == 'hello world'
+    assert r.trailers == {'X-Trailer': 'yes'}
+
+
+def test_no_content_response(aio_routes):
+    r = asyncio.run(aio.delete(aio_routes.url + '/aio_no_content'))
+    assert r.status_code == '204'
+    assert r.text == ''
+
+
+def test_save_to_file(aio_routes, tmp_path):
+    file_name = str(tmp_path / 'echo.json')
+    asyncio.run(aio.get(aio_routes.url + '/echo', save_to_file=file_name))
+    with open(file_name, 'r') as reader:
+        assert json.loads(reader.read())['method'] == 'GET'
+
+
+def test_requests_run_concurrently(aio_routes):
+    async def fan_out():
+        return await asyncio.gather(*(aio.get(aio_routes.url + '/aio_slow') for _ in range(4)))
+
+    start = time.monotonic()
+    responses = asyncio.run(fan_out())
+    assert time.monotonic() - start < 1.0
+    assert [r.text for r in responses] == ['slow'] * 4
+
+
+def test_timeout(aio_routes):
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(aio.get(aio_routes.url + '/aio_slow', timeout=0.05))
+
+
+def test_https_uses_shared_tls_context(tls_server):
+    import ssl
+    from uhttp import requests
+    requests.tls_cache.set_context('127.0.0.1', ssl.create_default_context(cafile='tests/static/localhost.crt'))
+    try:
+        r = asyncio.run(aio.get(tls_server.url + '/echo'))
+        assert r.json['method'] == 'GET'
+    finally:
+        requests.tls_cache.clear()
+
+
+def test_decompress(aio_routes):
+    import gzip
+    document = json.dumps({'schedule': list(range(300))}).encode()
+    aio_routes.add_route('/aio_gzip', lambda handler, body: (200, {'Content-Encoding': 'gzip'}, gzip.compress(document)))
+    r = asyncio.run(aio.get(aio_routes.url + '/aio_gzip', decompress=True))
+    assert r.content == document
+
+
+def test_timings(aio_routes):
+    r = asyncio.run(aio.post(aio_routes.url + '/echo', json={'a': 1}))
+    assert r.timings.status == 200
+    assert r.timings.bytes_sent > 0 and r.timings.bytes_received > 0
+    assert r.timings.durations()['total'] >= 0
+
+
+def test_download_segmented(ranged_image, tmp_path):
+    file_name = str(tmp_path / 'image.bin')
+    r = asyncio.run(aio.download_segmented(ranged_image['url'], file_name, segments=4))
+    assert r.status == 200
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == ranged_image['content']
+    assert len(ranged_image['seen']) == 5
+    assert ranged_image['peak'] > 1
+
+
+def test_download_segmented_without_ranges(ranged_image, tmp_path):
+    ranged_image['ranges'] = False
+    file_name = str(tmp_path / 'image.bin')
+    asyncio.run(aio.download_segmented(ranged_image['url'], file_name))
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == ranged_image['content']
+    assert ranged_image['seen'] == [('HEAD', None), ('GET', None)]
+
+
+def test_download_segmented_rejects_chunked_range(ranged_image, tmp_path):
+    ranged_image['chunked'] = True
+    with pytest.raises(OSError, match='Transfer-Encoding'):
+        asyncio.run(aio.download_segmented(ranged_image['url'], str(tmp_path / 'image.bin'), segments=2))
+
+
+def test_body_read_until_close(raw_server):
+    raw_server['response'] = b'HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n\r\n{"interval": 30}'
+    r = asyncio.run(aio.get(raw_server['url'] + '/unframed'))
+    assert r.json == {'interval': 30}
@@ -0,0 +1,130 @@
+import pytest
+
+from uhttp import requests
+from uhttp.cache import HttpCache, freshness_lifetime, parse_http_date
+
+
+@pytest.fixture(scope='module')
+def cache_routes(keep_alive_server):
+    hits = {}
+
+    def route(path, headers, body=b'{"interval": 30}', etag=None):
+        def callback(handler, request_body):
+            hits[path] = hits.get(path, 0) + 1
+            response_headers = dict(headers)
+            if etag is not None:
+                response_headers['ETag'] = etag
+                if handler.headers.get('If-None-Match') == etag:
+                    return 304, response_headers, b''
+            return 200, response_headers, body
+
+        keep_alive_server.add_route(path, callback)
+
+    route('/fresh', {'Cache-Control': 'max-age=60'}, etag='"a"')
+    route('/revalidate', {'Cache-Control': 'no-cache'}, etag='"b"')
+    route('/expires', {'Expires': 'Thu, 01 Jan 2099 00:00:00 GMT'})
+    route('/no_store', {'Cache-Control': 'no-store, max-age=60'})
+    route('/chunked', {'Cache-Control': 'max-age=60', 'Transfer-Encoding': 'chunked'},
+          body=b'5\r\nhello\r\n0\r\n\r\n')
+    for name in ('a', 'b', 'c'):
+        route('/sized_' + name, {'Cache-Control': 'max-age=60'}, body=name.encode() * 400)
+    return keep_alive_server, hits
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(str(tmp_path / 'http_cache'), max_bytes=64 * 1024)
+
+
+def test_parse_http_date_and_freshness():
+    assert parse_http_date('Sun, 06 Nov 1994 08:49:37 GMT') == 784111777
+    assert parse_http_date('0') is None
+    assert freshness_lifetime(requests.Headers({'Cache-Control': 'max-age=60', 'Age': '15'})) == 45
+    assert freshness_lifetime(requests.Headers({'Cache-Control': 'no-cache, max-age=60'})) == 0
+    assert freshness_lifetime(requests.Headers({'Date': 'Sun, 06 Nov 1994 08:49:37 GMT',
+                                                'Expires': 'Mon, 07 Nov 1994 08:49:37 GMT'})) == 86400
+    assert freshness_lifetime(requests.Headers({'Expires': '0'})) == 0
+
+
+def test_fresh_entry_served_from_disk(cache_routes, cache):
+    server, hits = cache_routes
+    first = requests.get(server.url + '/fresh', cache=cache)
+    assert first.from_cache is False
+    second = requests.get(server.url + '/fresh', cache=cache)
+    assert second.from_cache == 'hit'
+    assert second.json == {'interval': 30}
+    assert second.headers['ETag'] == '"a"'
+    assert 'Connection' not in second.headers
+    assert hits['/fresh'] == 1
+
+
+def test_stale_entry_revalidated(cache_routes, cache):
+    server, hits = cache_routes
+    requests.get(server.url + '/revalidate', cache=cache)
+    r = requests.get(server.url + '/revalidate', cache=cache)
+    assert r.from_cache == 'revalidated'
+    assert r.status == 200
+    assert r.json == {'interval': 30}
+    assert hits['/revalidate'] == 2
+
+
+def test_expires_date_and_chunked_bodies(cache_routes, cache):
+    server, hits = cache_routes
+    requests.get(server.url + '/expires', cache=cache)
+    assert requests.get(server.url + '/expires', cache=cache).from_cache == 'hit'
+    requests.get(server.url + '/chunked', cache=cache)
+    r = requests.get(server.url + '/chunked', cache=cache)
+    assert r.from_cache == 'hit' and r.content == b'hello'
+
+
+def test_no_store_is_not_cached(cache_routes, cache):
+    server, hits = cache_routes
+    requests.get(server.url + '/no_store', cache=cache)
+    assert requests.get(server.url + '/no_store', cache=cache).from_cache is False
+
+
+def test_lru_eviction_within_budget(cache_routes, tmp_path):
+    server, hits = cache_routes
+    cache = HttpCache(str(tmp_path / 'small'), max_bytes=1500)
+    requests.get(server.url + '/sized_a', cache=cache)
+    requests.get(server.url + '/sized_b', cache=cache)
+    assert requests.get(server.url + '/sized_a', cache=cache).from_cache == 'hit'
+    requests.get(server.url + '/sized_c', cache=cache)  # Evicts b, the least recently used
+    reopened = HttpCache(str(tmp_path / 'small'), max_bytes=1500)
+    assert requests.get(server.url + '/sized_c', cache=reopened).from_cache == 'hit'
+    assert requests.get(server.url + '/sized_b', cache=reopened).from_cache is False
+    assert sum(reopened._sizes.values()) <= 1500
+
+
+def test_session_cache(cache_routes, cache):
+    server, hits = cache_routes
+    with requests.Session(cache=cache) as session:
+        session.get(server.url + '/fresh')
+        assert session.get(server.url + '/fresh').from_cache == 'hit'
+        assert session.post(server.url + '/fresh').from_cache is False
+    cache.clear()
+    assert requests.get(server.url + '/fresh', cache=cache).from_cache is False
+
+
+def test_key_includes_representation_headers(cache_routes, cache):
+    server, hits = cache_routes
+    url = server.url + '/fresh'
+    assert HttpCache.key(url, {'accept': 'text/csv'}) == HttpCache.key(url, {'Accept': 'text/csv', 'X-Trace': '1'})
+    assert HttpCache.key(url) != HttpCache.key(url, {'Accept': 'text/csv'})
+    assert HttpCache.key(url) != HttpCache.key(url, decompress=True)
+    requests.get(url, cache=cache)
+    assert requests.get(url, cache=cache, custom_headers={'Accept': 'text/csv'}).from_cache is False
+    assert requests.get(url, cache=cache, custom_headers={'Accept': 'text/csv'}).from_cache == 'hit'
+    assert requests.get(url, cache=cache).from_cache == 'hit'
+
+
+def test_requests_with_credentials_bypass_cache(cache_routes, cache):
+    server, hits = cache_routes
+    url = server.url + '/fresh'
+    requests.get(url, cache=cache)
+    before = hits['/fresh']
+    for _ in range(2):
+        r = requests.get(url, cache=cache, custom_headers={'Authorization': 'Bearer device-7'})
+        assert r.from_cache is False
+    assert hits['/fresh'] == before + 2
+    assert len(cache._order) == 1
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from uhttp import json_stream
+
+DOCUMENT = {
+    'state': {
+        'reported': {
+            'firmware': '1.4.2',
+            'readings': [{'sensor': index, 'value': index / 4, 'ok': index % 2 == 0} for index in range(50)],
+        },
+        'desired': {'interval': 30, 'label': 'café "north" \\ ☃', 'tags': [], 'meta': {}},
+    },
+    'version': -12,
+    'exponent': 1.5e-7,
+    'missing': None,
+}
+
+
+def one_byte_chunks(data: bytes):
+    return (data[index:index + 1] for index in range(len(data)))
+
+
+def test_iterencode_round_trips():
+    pieces = list(json_stream.iterencode(DOCUMENT))
+    assert json.loads(''.join(pieces)) == DOCUMENT
+    assert max(len(piece) for piece in pieces) < 64
+    assert ''.join(json_stream.iterencode([])) == '[]'
+    assert ''.join(json_stream.iterencode({'a': [{}]})) == '{"a":[{}]}'
+
+
+def test_json_events_across_chunk_boundaries():
+    data = json.dumps({'a': [1, 'x', True], 'b': {'c': None}}).encode()
+    assert list(json_stream.JsonEvents(one_byte_chunks(data))) == [
+        ('', 'start_map', None),
+        ('', 'map_key', 'a'),
+        ('a', 'start_array', None),
+        ('a.item', 'number', 1),
+        ('a.item', 'string', 'x'),
+        ('a.item', 'boolean', True),
+        ('a', 'end_array', None),
+        ('', 'map_key', 'b'),
+        ('b', 'start_map', None),
+        ('b', 'map_key', 'c'),
+        ('b.c', 'null', None),
+        ('b', 'end_map', None),
+        ('', 'end_map', None),
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_items_selects_values_by_prefix(chunk_size):
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode()
+    chunks = [data[index:index + chunk_size] for index in range(0, len(data), chunk_size)]
+    assert list(json_stream.items(chunks, 'state.reported.readings.item')) == DOCUMENT['state']['reported']['readings']
+    assert list(json_stream.items(chunks, 'state.desired')) == [DOCUMENT['state']['desired']]
+    assert list(json_stream.items(chunks, 'exponent')) == [1.5e-7]
+    assert list(json_stream.items(chunks, '')) == [DOCUMENT]
+
+
+def test_truncated_document_raises():
+    with pytest.raises(ValueError):
+        list(json_stream.JsonEvents([b'{"a": [1, 2']))
+    with pytest.raises(ValueError):
+        list(json_stream.JsonEvents([b'{"a": "open']))
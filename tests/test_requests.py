@@ -249,3 +249,1096 @@ def test_post_file_chunked(mock_server, image_file_bytes):
     r = requests.post('http://127.0.0.1:5000/serialize_request', file='tests/static/image.png', chunked=True,
                       chunk_size=128)
     assert base64.b64decode(r.json['data']) == image_file_bytes
+
+
+def test_socket_interface_buffered_reads():
+    import socket
+    server, client = socket.socketpair()
+    body = os.urandom(3 * requests.READ_BUFFER_SIZE)
+    server.sendall(b'HTTP/1.1 200 OK\r\nX-Long: ' + b'a' * 5000 + b'\r\n\r\n' + body + b'tail')
+    server.close()
+    sock = requests.SocketInterface(client)
+    assert sock.readline() == b'HTTP/1.1 200 OK\r\n'
+    assert sock.readline() == b'X-Long: ' + b'a' * 5000 + b'\r\n'
+    assert sock.readline() == b'\r\n'
+    assert sock.read(10) == body[:10]
+    buff = bytearray(len(body) - 10)
+    assert sock.readinto(buff) == len(buff)
+    assert buff == body[10:]
+    assert sock.read() == b'tail'
+    assert sock.readline() == b''
+    sock.close()
+
+
+def test_session_reuses_connection(keep_alive_server):
+    with requests.Session() as session:
+        r = session.get(keep_alive_server.url + '/echo')
+        first_port = r.json['port']
+        (pooled, _), = session.pool._idle[(b'http:', b'127.0.0.1', keep_alive_server.port)]
+        r = session.post(keep_alive_server.url + '/echo', json={'n': 1})
+        assert r.json['port'] == first_port
+        assert json.loads(base64.b64decode(r.json['data'])) == {'n': 1}
+        (reused, _), = session.pool._idle[(b'http:', b'127.0.0.1', keep_alive_server.port)]
+        assert reused is pooled
+
+
+def test_session_honours_connection_close(mock_server):
+    with requests.Session() as session:
+        r = session.get('http://127.0.0.1:5000/serialize_request')
+        assert r.json['method'] == 'GET'
+        assert not session.pool._idle.get((b'http:', b'127.0.0.1', 5000))
+
+
+def test_session_reconnects_stale_connection(keep_alive_server):
+    import socket
+    with requests.Session() as session:
+        session.get(keep_alive_server.url + '/echo')
+        (pooled, _), = session.pool._idle[(b'http:', b'127.0.0.1', keep_alive_server.port)]
+        pooled._sock.close()
+        stale, peer = socket.socketpair()
+        peer.close()
+        pooled._sock = stale
+        r = session.get(keep_alive_server.url + '/echo')
+        assert r.json['method'] == 'GET'
+        (fresh, _), = session.pool._idle[(b'http:', b'127.0.0.1', keep_alive_server.port)]
+        assert fresh is not pooled
+
+
+@pytest.fixture
+def counted_route(keep_alive_server, monkeypatch):
+    import io
+    import socket
+    import struct
+    monkeypatch.setattr(requests, 'SOCKET_TIMEOUT', 0.5)
+    state = {'calls': 0, 'fail': None, 'url': keep_alive_server.url + '/counted'}
+
+    def callback(handler, body):
+        state['calls'] += 1
+        failure, state['fail'] = state['fail'], None
+        if failure == 'stall':
+            time.sleep(1)
+        elif failure == 'reset':
+            # Linger off makes close() send a reset, once the handler's file objects no longer hold the socket.
+            handler.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            handler.rfile.close()
+            handler.wfile.close()
+            handler.connection.close()
+            handler.close_connection = True
+            handler.wfile = io.BytesIO()
+        return 200, {}, b'ok'
+
+    keep_alive_server.add_route('/counted', callback)
+    return state
+
+
+@pytest.mark.parametrize('method, failure', [('POST', 'stall'), ('POST', 'reset'), ('GET', 'stall')])
+def test_session_does_not_resend_delivered_request(counted_route, method, failure):
+    with requests.Session() as session:
+        session.get(counted_route['url'])
+        counted_route['calls'], counted_route['fail'] = 0, failure
+        with pytest.raises(OSError):
+            session.request(counted_route['url'], method=method, json={'reading': 1})
+        assert counted_route['calls'] == 1
+
+
+def test_session_idle_timeout(keep_alive_server):
+    with requests.Session(idle_timeout=0) as session:
+        first = session.get(keep_alive_server.url + '/echo').json['port']
+        second = session.get(keep_alive_server.url + '/echo').json['port']
+        assert first != second
+
+
+def test_request_without_session_closes_connection(mock_server):
+    r = requests.get('http://127.0.0.1:5000/serialize_request')
+    assert r.json['Connection'] == 'close'
+
+
+def chunked_payload(data: bytes, chunk_size: int) -> bytes:
+    chunks = [data[index:index + chunk_size] for index in range(0, len(data), chunk_size)]
+    return b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in chunks) + b'0\r\n\r\n'
+
+
+CSV_LINES = [b'id,value'] + [b'%d,%d' % (index, index * index) for index in range(200)]
+
+
+@pytest.fixture(scope='session')
+def streaming_routes(keep_alive_server):
+    csv = b'\r\n'.join(CSV_LINES) + b'\r\n'
+    keep_alive_server.add_route('/csv', lambda handler, body: (200, {'Content-Type': 'text/csv'}, csv))
+    keep_alive_server.add_route('/csv_chunked', lambda handler, body: (
+        200, {'Content-Type': 'text/csv', 'Transfer-Encoding': 'chunked'}, chunked_payload(csv, 100)))
+    return csv
+
+
+@pytest.mark.parametrize('path', ['/csv', '/csv_chunked'])
+def test_stream_iter_lines(keep_alive_server, streaming_routes, path):
+    with requests.get(keep_alive_server.url + path, stream=True) as r:
+        assert r.status_code == '200'
+        assert list(r.iter_lines(chunk_size=64)) == CSV_LINES
+
+
+@pytest.mark.parametrize('path', ['/csv', '/csv_chunked'])
+def test_stream_iter_content_and_readinto(keep_alive_server, streaming_routes, path):
+    r = requests.get(keep_alive_server.url + path, stream=True)
+    first = next(r.iter_content(chunk_size=10))
+    buff = bytearray(32)
+    read = r.readinto(buff)
+    assert first + buff[:read] == streaming_routes[:10 + read]
+    assert first + buff[:read] + r.content == streaming_routes
+    assert r.readinto(buff) == 0
+
+
+@pytest.mark.parametrize('path', ['/csv', '/csv_chunked'])
+def test_stream_session_reuses_connection_after_body(keep_alive_server, streaming_routes, path):
+    with requests.Session() as session:
+        r = session.get(keep_alive_server.url + path, stream=True)
+        assert not session.pool._idle.get((b'http:', b'127.0.0.1', keep_alive_server.port))
+        assert r.text.encode() == streaming_routes
+        assert len(session.pool._idle[(b'http:', b'127.0.0.1', keep_alive_server.port)]) == 1
+        assert session.get(keep_alive_server.url + '/echo').json['method'] == 'GET'
+
+
+def test_stream_close_discards_unread_body(keep_alive_server, streaming_routes):
+    with requests.Session() as session:
+        with session.get(keep_alive_server.url + '/csv', stream=True) as r:
+            next(r.iter_content(chunk_size=10))
+        assert not session.pool._idle.get((b'http:', b'127.0.0.1', keep_alive_server.port))
+
+
+@pytest.fixture(scope='session')
+def firmware_routes(keep_alive_server):
+    firmware = os.urandom(5 * requests.READ_BUFFER_SIZE + 123)
+    keep_alive_server.add_route('/firmware', lambda handler, body: (200, {}, firmware))
+    keep_alive_server.add_route('/firmware_chunked', lambda handler, body: (
+        200, {'Transfer-Encoding': 'chunked'}, chunked_payload(firmware, 3000)))
+    return firmware
+
+
+@pytest.mark.parametrize('path', ['/firmware', '/firmware_chunked'])
+def test_save_to_file_large_body(keep_alive_server, firmware_routes, tmp_path, path):
+    file_name = str(tmp_path / 'firmware.bin')
+    requests.get(keep_alive_server.url + path, save_to_file=file_name)
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == firmware_routes
+
+
+@pytest.mark.parametrize('path', ['/firmware', '/firmware_chunked'])
+def test_get_into_buffer(keep_alive_server, firmware_routes, path):
+    buff = bytearray(len(firmware_routes) + 10)
+    r = requests.get(keep_alive_server.url + path, into=buff)
+    assert isinstance(r.content, memoryview)
+    assert len(r.content) == len(firmware_routes)
+    assert buff[:len(firmware_routes)] == firmware_routes
+
+
+@pytest.mark.parametrize('path', ['/firmware', '/firmware_chunked'])
+def test_get_into_buffer_too_small(keep_alive_server, firmware_routes, path):
+    with pytest.raises(ValueError):
+        requests.get(keep_alive_server.url + path, into=bytearray(len(firmware_routes) - 1))
+
+
+def test_get_into_buffer_json(keep_alive_server):
+    r = requests.get(keep_alive_server.url + '/echo', into=bytearray(1024))
+    assert r.json['method'] == 'GET'
+
+
+def chunked_socket(payload: bytes):
+    import socket
+    server, client = socket.socketpair()
+    server.sendall(payload)
+    server.close()
+    return requests.SocketInterface(client)
+
+
+def test_chunked_decoder_extensions_and_trailers():
+    payload = b'5;name=value\r\nhello\r\nA \r\n, chunked!\r\n0\r\nChecksum: abc\r\nX-Count: 2\r\n\r\nNEXT'
+    sock = chunked_socket(payload)
+    decoder = requests.ChunkedDecoder(sock)
+    assert decoder.decode() == b'hello, chunked!'
+    assert decoder.done
+    assert decoder.trailers == {'Checksum': 'abc', 'X-Count': '2'}
+    assert sock.read(4) == b'NEXT'
+
+
+def test_chunked_decoder_debug_hook_and_sink():
+    messages = []
+    decoder = requests.ChunkedDecoder(chunked_socket(chunked_payload(b'x' * 1000, 300)))
+    decoder.debug = messages.append
+    written = []
+    decoder.decode_to(lambda data: written.append(bytes(data)), block_size=128)
+    assert b''.join(written) == b'x' * 1000
+    assert max(len(data) for data in written) == 128
+    assert messages == ['Chunk Length: 300'] * 3 + ['Chunk Length: 100', 'Chunk Length: 0']
+
+
+@pytest.mark.parametrize('payload', [b'zz\r\nhello\r\n0\r\n\r\n', b'\r\n', b'5\r\nhelloXX0\r\n\r\n'])
+def test_chunked_decoder_rejects_malformed_body(payload):
+    with pytest.raises(ValueError):
+        requests.ChunkedDecoder(chunked_socket(payload)).decode()
+
+
+def test_http_post_body_multi_file_chunked(mock_server, image_file_bytes, index_file_bytes):
+    http_body = requests.HttpBodyMultiFile([
+        requests.HttpBodyMultiFileSection('my_image', file_path='tests/static/image.png'),
+        requests.HttpBodyMultiFileSection('my_index', file_path='tests/static/index.html'),
+        requests.HttpBodyMultiFileSection('just-text', value="This is just some text"),
+    ], chunked=True)
+    http_request = requests.HttpRequest('http://127.0.0.1:5000/serialize_request', body=http_body, method='POST')
+    assert 'chunked' in http_request.response.json['Transfer-Encoding']
+    assert http_request.response.json['form'] == {'just-text': "This is just some text"}
+    assert base64.b64decode(http_request.response.json['files']['my_image']) == image_file_bytes
+    assert base64.b64decode(http_request.response.json['files']['my_index']) == index_file_bytes
+
+
+class CountingSocket:
+    def __init__(self):
+        self.data_len = 0
+        self.writes = 0
+        self.tail = b''
+
+    def write(self, data):
+        self.data_len += len(data)
+        self.writes += 1
+        self.tail = (self.tail + bytes(data))[-64:]
+
+
+def test_http_body_multi_file_streams_from_disk(tmp_path):
+    import tracemalloc
+    file_name = str(tmp_path / 'frame.bin')
+    with open(file_name, 'wb') as writer:
+        writer.write(os.urandom(1024 * 1024))
+    tracemalloc.start()
+    http_body = requests.HttpBodyMultiFile([
+        requests.HttpBodyMultiFileSection('frame', file_path=file_name),
+        requests.HttpBodyMultiFileSection('sidecar', value='{"exposure": 10}'),
+    ])
+    sock = CountingSocket()
+    http_body.send_body(sock)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 64 * 1024
+    headers = b'Content-Type: multipart/form-data; boundary=%s\r\nContent-Length: %d\r\n\r\n' % (
+        http_body._boundary, http_body.content_len)
+    assert sock.data_len == len(headers) + http_body.content_len
+    assert sock.tail.endswith(b'--%s--\r\n' % http_body._boundary)
+
+
+def test_http_body_file_uses_sendfile(keep_alive_server, tmp_path, monkeypatch):
+    import socket
+    file_name = str(tmp_path / 'archive.bin')
+    archive = os.urandom(256 * 1024)
+    with open(file_name, 'wb') as writer:
+        writer.write(archive)
+    calls = []
+    sendfile = socket.socket.sendfile
+
+    def spy(self, file, offset=0, count=None):
+        calls.append(count)
+        return sendfile(self, file, offset, count)
+
+    monkeypatch.setattr(socket.socket, 'sendfile', spy)
+    http_body = requests.HttpBodyFile(file_name=file_name)
+    assert http_body.content_len == len(archive)
+    r = requests.HttpRequest(keep_alive_server.url + '/echo', body=http_body, method='POST').response
+    assert calls == [len(archive)]
+    assert base64.b64decode(r.json['data']) == archive
+
+
+def test_http_body_file_streams_without_sendfile(tmp_path):
+    import tracemalloc
+    file_name = str(tmp_path / 'archive.bin')
+    with open(file_name, 'wb') as writer:
+        writer.write(os.urandom(1024 * 1024))
+    tracemalloc.start()
+    http_body = requests.HttpBodyFile(file_name=file_name)
+    sock = CountingSocket()
+    http_body.send_body(sock)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 64 * 1024
+    assert sock.data_len > http_body.content_len
+
+
+@pytest.fixture
+def send_calls(monkeypatch, keep_alive_server):
+    import socket
+    calls = []
+    for name in ('send', 'sendall', 'sendmsg'):
+        def spy(self, *args, __name=name, __original=getattr(socket.socket, name)):
+            if self.getpeername()[1] == keep_alive_server.port:  # Ignore the server answering
+                calls.append(__name)
+            return __original(self, *args)
+
+        monkeypatch.setattr(socket.socket, name, spy)
+    return calls
+
+
+def test_small_request_sent_in_one_write(keep_alive_server, send_calls):
+    r = requests.post(keep_alive_server.url + '/echo', json={'temperature': 21.5},
+                      custom_headers={'Authorization': 'Bearer token', 'X-Device': 'sensor-1'})
+    assert send_calls == ['sendall']
+    assert r.json['headers']['X-Device'] == 'sensor-1'
+    assert json.loads(base64.b64decode(r.json['data'])) == {'temperature': 21.5}
+
+
+def test_large_body_sent_with_scatter_gather(keep_alive_server, send_calls):
+    data = {'samples': list(range(2000))}
+    r = requests.post(keep_alive_server.url + '/echo', json=data)
+    assert send_calls == ['sendmsg']
+    assert json.loads(base64.b64decode(r.json['data'])) == data
+
+
+@pytest.fixture
+def getaddrinfo_calls(monkeypatch):
+    calls = []
+    getaddrinfo = requests.usocket.getaddrinfo
+
+    def spy(host, port, *args):
+        calls.append((host, port))
+        return getaddrinfo(host, port, *args)
+
+    monkeypatch.setattr(requests.usocket, 'getaddrinfo', spy)
+    requests.dns_cache.flush()
+    yield calls
+    requests.dns_cache.flush()
+
+
+def test_dns_cache_reuses_lookups(keep_alive_server, getaddrinfo_calls):
+    r = requests.get('http://localhost:%d/echo' % keep_alive_server.port)
+    requests.get('http://localhost:%d/echo' % keep_alive_server.port)
+    assert getaddrinfo_calls == [(b'127.0.0.1', keep_alive_server.port)]
+    assert r.json['headers']['Host'] == 'localhost'
+    requests.dns_cache.flush('localhost')
+    requests.get('http://localhost:%d/echo' % keep_alive_server.port)
+    assert len(getaddrinfo_calls) == 2
+
+
+def test_dns_cache_expiry_and_lru(getaddrinfo_calls, monkeypatch):
+    cache = requests.DnsCache(ttl=60, max_size=2)
+    now = [0]
+    monkeypatch.setattr(requests, 'ticks_ms', lambda: now[0])
+    cache.resolve('127.0.0.1', 1)
+    cache.resolve('127.0.0.1', 2)
+    cache.resolve('127.0.0.1', 1)
+    cache.resolve('127.0.0.1', 3)  # Evicts port 2, the least recently used
+    cache.resolve('127.0.0.1', 1)
+    cache.resolve('127.0.0.1', 2)
+    assert [port for _, port in getaddrinfo_calls] == [1, 2, 3, 2]
+    now[0] = 61 * 1000
+    cache.resolve('127.0.0.1', 2)
+    assert [port for _, port in getaddrinfo_calls] == [1, 2, 3, 2, 2]
+
+
+def test_dns_cache_negative_caching_and_prime(monkeypatch):
+    calls = []
+
+    def failing_getaddrinfo(*args):
+        calls.append(args)
+        raise OSError(-2, 'Name or service not known')
+
+    monkeypatch.setattr(requests.usocket, 'getaddrinfo', failing_getaddrinfo)
+    cache = requests.DnsCache(negative_ttl=60)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            cache.resolve('device.invalid', 80)
+    assert len(calls) == 1
+    address_info = [(2, 1, 6, '', ('10.0.0.1', 80))]
+    cache.prime('device.invalid', 80, address_info)
+    assert cache.resolve(b'device.invalid', 80) == address_info
+
+
+@pytest.fixture
+def trusted_tls(tls_server):
+    import ssl
+    context = ssl.create_default_context(cafile='tests/static/localhost.crt')
+    requests.tls_cache.set_context('127.0.0.1', context)
+    yield tls_server
+    requests.tls_cache.clear()
+
+
+def test_tls_session_resumption(trusted_tls):
+    first = requests.get(trusted_tls.url + '/echo')
+    assert first.json['method'] == 'GET'
+    assert not first.tls_resumed
+    second = requests.get(trusted_tls.url + '/echo')
+    assert second.tls_resumed
+    assert second.json['method'] == 'GET'
+
+
+def test_tls_session_expiry(trusted_tls, monkeypatch):
+    requests.get(trusted_tls.url + '/echo')
+    now = requests.ticks_ms()
+    monkeypatch.setattr(requests, 'ticks_ms', lambda: now + (requests.tls_cache.session_lifetime + 1) * 1000)
+    assert requests.tls_cache.session('127.0.0.1') is None
+    assert not requests.get(trusted_tls.url + '/echo').tls_resumed
+
+
+def test_tls_context_is_reused_per_host(trusted_tls):
+    context = requests.tls_cache.context('127.0.0.1')
+    with requests.Session() as session:
+        assert session.get(trusted_tls.url + '/echo').json['method'] == 'GET'
+    assert requests.tls_cache.context(b'127.0.0.1') is context
+    assert requests.tls_cache.context('example.com') is not context
+
+
+def test_session_pipeline(keep_alive_server):
+    with requests.Session() as session:
+        http_requests = [session.prepare(keep_alive_server.url + '/echo?key=%d' % index) for index in range(5)]
+        http_requests.append(session.prepare(keep_alive_server.url + '/echo', method='POST', json={'n': 1}))
+        responses = list(session.pipeline(http_requests))
+        assert [r.json['path'] for r in responses[:5]] == ['/echo?key=%d' % index for index in range(5)]
+        assert json.loads(base64.b64decode(responses[5].json['data'])) == {'n': 1}
+        assert len({r.json['port'] for r in responses}) == 1
+        assert [http_request.response for http_request in http_requests] == responses
+        assert len(session.pool._idle[(b'http:', b'127.0.0.1', keep_alive_server.port)]) == 1
+
+
+def test_session_pipeline_falls_back_when_server_closes(keep_alive_server):
+    keep_alive_server.add_route('/close', lambda handler, body: (200, {'Connection': 'close'}, b'closing'))
+    with requests.Session() as session:
+        paths = ['/echo', '/close', '/echo', '/echo']
+        responses = list(session.pipeline([session.prepare(keep_alive_server.url + path) for path in paths]))
+        assert responses[1].text == 'closing'
+        assert [r.json['path'] for r in responses[2:]] == ['/echo', '/echo']
+        assert responses[0].json['port'] != responses[2].json['port']
+
+
+def test_session_pipeline_rejects_mixed_hosts(keep_alive_server):
+    with requests.Session() as session:
+        http_requests = [session.prepare(keep_alive_server.url + '/echo'), session.prepare('http://localhost:1/')]
+        with pytest.raises(ValueError):
+            list(session.pipeline(http_requests))
+
+
+@pytest.fixture(scope='session')
+def compressed_routes(keep_alive_server):
+    import gzip
+    import zlib
+    document = json.dumps({'config': [{'key': index, 'value': 'setting-%d' % index} for index in range(500)]}).encode()
+
+    def compressed(content_encoding, chunked=False):
+        payload = {'gzip': gzip.compress(document), 'deflate': zlib.compress(document),
+                   'raw': zlib.compress(document)[2:-4]}[content_encoding]
+        headers = {'Content-Encoding': 'deflate' if content_encoding == 'raw' else content_encoding}
+        if chunked:
+            headers['Transfer-Encoding'] = 'chunked'
+            payload = chunked_payload(payload, 700)
+
+        def callback(handler, body):
+            if 'gzip' not in handler.headers.get('Accept-Encoding', ''):
+                return 200, {}, document
+            return 200, headers, payload
+
+        return callback
+
+    for content_encoding in ('gzip', 'deflate', 'raw'):
+        keep_alive_server.add_route('/%s' % content_encoding, compressed(content_encoding))
+        keep_alive_server.add_route('/%s_chunked' % content_encoding, compressed(content_encoding, chunked=True))
+    return document
+
+
+@pytest.mark.parametrize('path', ['/gzip', '/deflate', '/raw', '/gzip_chunked', '/deflate_chunked', '/raw_chunked'])
+def test_decompress_response(keep_alive_server, compressed_routes, path, tmp_path):
+    assert requests.get(keep_alive_server.url + path).content == compressed_routes
+    r = requests.get(keep_alive_server.url + path, decompress=True)
+    assert r.headers['Content-Encoding'] in ('gzip', 'deflate')
+    assert r.content == compressed_routes
+    assert r.json['config'][499]['value'] == 'setting-499'
+    file_name = str(tmp_path / 'config.json')
+    requests.get(keep_alive_server.url + path, decompress=True, save_to_file=file_name)
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == compressed_routes
+    with requests.get(keep_alive_server.url + path, decompress=True, stream=True) as r:
+        assert b''.join(r.iter_content(100)) == compressed_routes
+
+
+def test_decompress_closed_early_returns_block(keep_alive_server, compressed_routes, monkeypatch):
+    pool = requests.BufferPool(max_free=8)
+    monkeypatch.setattr(requests, 'buffer_pool', pool)
+    r = requests.get(keep_alive_server.url + '/gzip', decompress=True, stream=True)
+    block = r._inflater._block
+    assert r.readinto(bytearray(100)) == 100
+    r.close()
+    assert r._inflater._block is None
+    assert block in pool._free
+    assert r.readinto(bytearray(100)) == 0
+
+
+@pytest.mark.parametrize('path', ['/gzip', '/gzip_chunked'])
+def test_decompress_session_reuses_connection(keep_alive_server, compressed_routes, path):
+    with requests.Session() as session:
+        session.get(keep_alive_server.url + path, decompress=True)
+        buff = bytearray(len(compressed_routes))
+        second = session.get(keep_alive_server.url + path, decompress=True, into=buff)
+        assert second.content == compressed_routes
+        assert len(session.pool._idle[(b'http:', b'127.0.0.1', keep_alive_server.port)]) == 1
+        with pytest.raises(ValueError):
+            session.get(keep_alive_server.url + path, decompress=True, into=bytearray(100))
+
+
+class CapturingSocket:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+
+def decompress_body(data: bytes, content_encoding: str) -> bytes:
+    import zlib
+    return zlib.decompress(data, 31 if content_encoding == 'gzip' else 15)
+
+
+@pytest.mark.parametrize('content_encoding', ['gzip', 'deflate'])
+def test_compress_json_and_form_bodies(keep_alive_server, content_encoding):
+    document = {'readings': [{'sensor': index, 'value': 20.5} for index in range(200)]}
+    r = requests.post(keep_alive_server.url + '/upload', json=document, compress=content_encoding)
+    sent = base64.b64decode(r.json['data'])
+    assert r.json['headers']['Content-Encoding'] == content_encoding
+    assert int(r.json['headers']['Content-Length']) == len(sent) < len(json.dumps(document))
+    assert json.loads(decompress_body(sent, content_encoding)) == document
+
+    r = requests.post(keep_alive_server.url + '/upload', data={'name': 'sensor' * 50}, compress=content_encoding)
+    assert r.json['headers']['Content-Encoding'] == content_encoding
+    assert decompress_body(base64.b64decode(r.json['data']), content_encoding) == b'name=' + b'sensor' * 50
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_compress_file_body_streams_chunks(tmp_path, chunked):
+    file_name = str(tmp_path / 'log.txt')
+    content = b''.join(b'%d,20.5,ok\n' % index for index in range(5000))
+    with open(file_name, 'wb') as writer:
+        writer.write(content)
+    http_body = requests.build_body(file=file_name, chunked=chunked, compress='gzip')
+    sock = CapturingSocket()
+    http_body.send_body(sock)
+    head, body = bytes(sock.data).split(b'\r\n\r\n', 1)
+    assert b'Content-Encoding: gzip' in head
+    assert b'Transfer-Encoding: chunked' in head
+    assert b'Content-Length' not in head
+    sent = requests.ChunkedDecoder(chunked_socket(body)).decode()
+    assert len(sent) < len(content)
+    assert decompress_body(bytes(sent), 'gzip') == content
+
+
+def test_compress_rejects_unknown_encoding():
+    with pytest.raises(ValueError):
+        requests.build_body(json={'a': 1}, compress='br')
+
+
+def test_post_json_chunked_streams_document(mock_server):
+    document = {'readings': [{'sensor': index, 'value': index / 2} for index in range(300)]}
+    r = requests.post('http://127.0.0.1:5000/serialize_request', json=document, chunked=True, chunk_size=256)
+    assert r.json['Content-Type'] == 'application/json'
+    assert r.json['data'] == document
+
+
+def test_post_json_chunked_writes_bounded_chunks():
+    document = {'readings': [{'sensor': index, 'value': index / 2} for index in range(300)]}
+    sock = CapturingSocket()
+    requests.build_body(json=document, chunked=True, chunk_size=256, compress='gzip').send_body(sock)
+    head, body = bytes(sock.data).split(b'\r\n\r\n', 1)
+    assert b'Transfer-Encoding: chunked' in head and b'Content-Encoding: gzip' in head
+    assert json.loads(decompress_body(bytes(requests.ChunkedDecoder(chunked_socket(body)).decode()), 'gzip')) == document
+
+
+def test_response_iter_json(keep_alive_server):
+    document = {'state': {'reported': {'readings': [{'sensor': index} for index in range(1000)]}}}
+    keep_alive_server.add_route('/shadow', lambda handler, body: (200, {'Transfer-Encoding': 'chunked'},
+                                                                  chunked_payload(json.dumps(document).encode(), 300)))
+    with requests.get(keep_alive_server.url + '/shadow', stream=True) as r:
+        readings = r.iter_json('state.reported.readings.item', chunk_size=64)
+        assert next(readings) == {'sensor': 0}
+        assert sum(1 for _ in readings) == 999
+    r = requests.get(keep_alive_server.url + '/shadow')
+    assert next(r.iter_json()) == ('', 'start_map', None)
+
+
+def test_response_headers_case_insensitive_and_repeated():
+    sock = chunked_socket(b'HTTP/1.1 201 Created\r\ncontent-length: 5\r\nSet-Cookie: a=1\r\nX-Tight:packed\r\n'
+                          b'set-cookie: b=2\r\nCONNECTION: close\r\n\r\nhello')
+    r = requests.HttpResponse(sock)
+    assert r.status == 201
+    assert r.status_code == '201'
+    assert r.status_text == 'Created'
+    assert r.http_ver == 'HTTP/1.1'
+    assert r.content == b'hello'
+    assert r.headers['Content-Length'] == '5'
+    assert r.headers.get('x-tight') == 'packed'
+    assert r.headers.get_all('Set-Cookie') == ['a=1', 'b=2']
+    assert r.headers['set-cookie'] == 'a=1, b=2'
+    assert 'Connection' in r.headers and 'Missing' not in r.headers
+    assert r.headers.get('Missing', 'default') == 'default'
+    assert r.headers.raw(b'connection') == b'close'
+    assert len(r.headers) == 5
+    with pytest.raises(KeyError):
+        r.headers['Missing']
+
+
+def test_response_lowercase_chunked_header():
+    sock = chunked_socket(b'HTTP/1.1 200 OK\r\ntransfer-encoding: Chunked\r\n\r\n' + chunked_payload(b'a' * 100, 30))
+    r = requests.HttpResponse(sock)
+    assert r.content == b'a' * 100
+
+
+def test_headers_compare_with_dict():
+    headers = requests.Headers({'Content-Type': 'text/plain'})
+    headers.add(b'X-Count', b'2')
+    assert headers == {'content-type': 'text/plain', 'X-Count': '2'}
+    assert headers.items() == [('Content-Type', 'text/plain'), ('X-Count', '2')]
+
+
+def test_timings_start_when_prepared_request_is_sent(keep_alive_server):
+    http_request = requests.HttpRequest(keep_alive_server.url + '/echo', send=False)
+    time.sleep(0.3)
+    r = http_request.request()
+    assert r.timings is http_request.timings
+    assert r.timings.durations()['total'] < 250
+
+
+def test_timings_fresh_and_reused(keep_alive_server):
+    with requests.Session() as session:
+        first = session.post(keep_alive_server.url + '/echo', json={'value': 1})
+        second = session.get(keep_alive_server.url + '/echo')
+    timings = first.timings
+    assert not timings.reused and timings.status == 200
+    assert None not in (timings.dns, timings.connect, timings.sent, timings.first_byte, timings.headers, timings.done)
+    assert timings.tls is None
+    assert timings.bytes_sent > len(b'{"value": 1}')
+    assert timings.bytes_received == len(b''.join(
+        [first._status_line] + [b'%s: %s\r\n' % pair for pair in zip(first.headers._names, first.headers._values)]
+        + [b'\r\n', first.content]))
+    durations = timings.durations()
+    assert durations['total'] >= durations['ttfb'] >= 0
+    assert second.timings.reused
+    assert second.timings.dns is None and second.timings.connect is None
+    assert second.timings.durations()['dns'] is None
+    assert second.timings.durations()['total'] >= 0
+
+
+def test_timings_tls_phase(trusted_tls):
+    r = requests.get(trusted_tls.url + '/echo')
+    assert r.timings.tls is not None
+    assert r.timings.durations()['tls'] >= 0
+
+
+def test_hooks_receive_events(keep_alive_server):
+    events = []
+    requests.hooks.append(lambda event, timings: events.append((event, timings.status)))
+    try:
+        requests.get(keep_alive_server.url + '/echo')
+    finally:
+        requests.hooks.clear()
+    assert [event for event, _ in events] == ['dns', 'connect', 'sent', 'headers', 'done']
+    assert events[-1][1] == 200
+    session_events = []
+    with requests.Session(hooks=[lambda event, timings: session_events.append(event)]) as session:
+        with session.get(keep_alive_server.url + '/echo', stream=True) as r:
+            assert session_events[-1] == 'headers'
+            r.content
+        session.get(keep_alive_server.url + '/echo')
+    requests.get(keep_alive_server.url + '/echo')
+    assert session_events == ['dns', 'connect', 'sent', 'headers', 'done', 'sent', 'headers', 'done']
+
+
+def test_import_is_silent_and_lazy():
+    import subprocess
+    import sys
+    probe = 'import sys; from uhttp import requests; print("uhttp.mime" in sys.modules, "types_map" in vars(requests))'
+    output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True).stdout
+    assert output == 'False False\n'
+
+
+def test_mime_lookup():
+    from uhttp import mime
+    assert mime.guess_type('.png') == 'image/png'
+    assert mime.guess_type('.JSON') == 'application/json'
+    assert mime.guess_type('.a') == 'application/octet-stream'
+    assert mime.guess_type('.unknown') is None
+    assert mime.guess_type(None, 'text/plain') == 'text/plain'
+    assert mime.guess_type('png', 'text/plain') == 'text/plain'
+    assert requests.types_map['.png'] == 'image/png'
+    assert len(requests.types_map) == 142
+    with pytest.raises(AttributeError):
+        requests.missing_name
+
+
+def address(family_name: str, host: str, port: int) -> tuple:
+    import socket
+    family = getattr(socket, family_name)
+    sockaddr = (host, port) if family == socket.AF_INET else (host, port, 0, 0)
+    return family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', sockaddr
+
+
+def test_interleave_address_families():
+    v6 = [address('AF_INET6', '::%d' % index, 80) for index in range(3)]
+    v4 = [address('AF_INET', '10.0.0.%d' % index, 80) for index in range(2)]
+    assert requests._interleave(v6 + v4) == [v6[0], v4[0], v6[1], v4[1], v6[2]]
+    assert requests._interleave(v6 + v4, family=v4[0][0]) == [v4[0], v6[0], v4[1], v6[1], v6[2]]
+
+
+@pytest.fixture
+def hanging_address():
+    '''An address whose accept queue is full, so new connects hang without an answer.'''
+    import socket
+    listener = socket.socket()
+    listener.bind(('127.0.0.2', 0))
+    listener.listen(0)
+    filler = socket.create_connection(listener.getsockname())
+    yield listener.getsockname()
+    filler.close()
+    listener.close()
+
+
+def test_connect_falls_back_and_remembers_family(keep_alive_server):
+    host = 'dual-stack.test'
+    requests.dns_cache.prime(host, keep_alive_server.port, [
+        address('AF_INET6', '::1', keep_alive_server.port + 1000),  # Refused
+        address('AF_INET', '127.0.0.1', keep_alive_server.port),
+    ])
+    try:
+        r = requests.get('http://%s:%d/echo' % (host, keep_alive_server.port))
+        assert r.json['method'] == 'GET'
+        import socket
+        assert requests.dns_cache.family(host) == socket.AF_INET
+    finally:
+        requests.dns_cache.flush(host)
+    assert requests.dns_cache.family(host) is None
+
+
+def test_connect_races_past_hanging_address(keep_alive_server, hanging_address):
+    host = 'slow-route.test'
+    requests.dns_cache.prime(host, keep_alive_server.port, [
+        address('AF_INET', hanging_address[0], hanging_address[1]),
+        address('AF_INET', '127.0.0.1', keep_alive_server.port),
+    ])
+    try:
+        started = time.monotonic()
+        r = requests.get('http://%s:%d/echo' % (host, keep_alive_server.port))
+        assert r.status == 200
+        assert requests.ATTEMPT_DELAY <= time.monotonic() - started < requests.SOCKET_TIMEOUT
+    finally:
+        requests.dns_cache.flush(host)
+
+
+def test_connect_times_out_on_hanging_address(hanging_address, monkeypatch):
+    monkeypatch.setattr(requests, 'SOCKET_TIMEOUT', 0.3)
+    requests.dns_cache.prime('hang.test', hanging_address[1], [address('AF_INET', *hanging_address)])
+    try:
+        with pytest.raises(OSError):
+            requests.get('http://hang.test:%d/' % hanging_address[1])
+    finally:
+        requests.dns_cache.flush('hang.test')
+
+
+@pytest.fixture
+def ota_image(keep_alive_server):
+    content = os.urandom(300 * 1024)
+    state = {'drops': 0, 'etag': '"v1"', 'content': content, 'seen': []}
+
+    def callback(handler, body):
+        range_header, if_range = handler.headers.get('Range'), handler.headers.get('If-Range')
+        state['seen'].append((range_header, if_range))
+        start = int(range_header[6:-1]) if range_header and if_range == state['etag'] else 0
+        payload = state['content'][start:]
+        headers = {'ETag': state['etag'], 'Content-Length': str(len(payload))}
+        status = 200
+        if start:
+            status = 206
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, len(state['content']) - 1, len(state['content']))
+        if state['drops']:
+            state['drops'] -= 1
+            handler.close_connection = True
+            payload = payload[:100 * 1024]
+        return status, headers, payload
+
+    keep_alive_server.add_route('/ota.bin', callback)
+    return state
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(time, 'sleep', calls.append)
+    return calls
+
+
+def test_download_closes_dropped_attempt(keep_alive_server, ota_image, sleeps, tmp_path, monkeypatch):
+    responses = []
+
+    class StallingResponse(requests.HttpResponse):
+        def __init__(self, *args, **kw):
+            super().__init__(*args, **kw)
+            responses.append(self)
+            self._reads = 0
+
+        def readinto(self, buff):
+            self._reads += 1
+            if self._reads > 2:
+                raise TimeoutError('timed out')
+            return super().readinto(buff)
+
+    monkeypatch.setattr(requests, 'HttpResponse', StallingResponse)
+    with pytest.raises(TimeoutError):
+        requests.download(keep_alive_server.url + '/ota.bin', str(tmp_path / 'ota.bin'), retries=1)
+    assert len(responses) == 2
+    assert all(r._released for r in responses)
+
+
+def test_download_resumes_after_drops(keep_alive_server, ota_image, sleeps, tmp_path):
+    file_name = str(tmp_path / 'ota.bin')
+    ota_image['drops'] = 2
+    r = requests.download(keep_alive_server.url + '/ota.bin', file_name, backoff=0.5)
+    assert r.status == 206
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == ota_image['content']
+    assert not os.path.exists(file_name + '.part')
+    assert ota_image['seen'] == [(None, None), ('bytes=102400-', '"v1"'), ('bytes=204800-', '"v1"')]
+    assert sleeps == [0.5, 1.0]
+
+
+def test_download_restarts_when_resource_changed(keep_alive_server, ota_image, sleeps, tmp_path):
+    file_name = str(tmp_path / 'ota.bin')
+    ota_image['drops'] = 1
+    with pytest.raises(OSError):
+        requests.download(keep_alive_server.url + '/ota.bin', file_name, retries=0)
+    with open(file_name + '.part') as reader:
+        assert reader.read() == '102400\n"v1"\n'
+    ota_image['etag'] = '"v2"'
+    ota_image['content'] = os.urandom(200 * 1024)
+    r = requests.download(keep_alive_server.url + '/ota.bin', file_name)
+    assert r.status == 200
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == ota_image['content']
+    assert ota_image['seen'][-1] == ('bytes=102400-', '"v1"')
+    assert not os.path.exists(file_name + '.part')
+
+
+def test_download_backoff_is_bounded(keep_alive_server, ota_image, sleeps, tmp_path):
+    ota_image['content'] = os.urandom(1024 * 1024)
+    ota_image['drops'] = 100
+    with pytest.raises(OSError):
+        requests.download(keep_alive_server.url + '/ota.bin', str(tmp_path / 'ota.bin'), retries=6, backoff=1,
+                          max_backoff=8)
+    assert sleeps == [1, 2, 4, 8, 8, 8]
+    ota_image['drops'] = 0
+    requests.download(keep_alive_server.url + '/ota.bin', str(tmp_path / 'ota.bin'))
+    assert ota_image['seen'][-1] == ('bytes=%d-' % (7 * 100 * 1024), '"v1"')
+    with open(str(tmp_path / 'ota.bin'), 'rb') as reader:
+        assert reader.read() == ota_image['content']
+
+
+@pytest.fixture
+def concurrency_route(keep_alive_server):
+    import threading
+    lock = threading.Lock()
+    state = {'active': {}, 'peak': {}, 'ports': set()}
+
+    def slow(handler, body):
+        host = handler.headers['Host']
+        with lock:
+            state['active'][host] = state['active'].get(host, 0) + 1
+            state['peak'][host] = max(state['peak'].get(host, 0), state['active'][host])
+            state['ports'].add(handler.client_address[1])
+        time.sleep(0.1)
+        with lock:
+            state['active'][host] -= 1
+        return 200, {}, handler.path.encode()
+
+    keep_alive_server.add_route('/slow', slow)
+    return state
+
+
+def test_map_requests_runs_in_parallel_with_per_host_limit(keep_alive_server, concurrency_route):
+    port = keep_alive_server.port
+    http_requests = [requests.HttpRequest('http://127.0.0.1:%d/slow?%d' % (port, index), send=False)
+                     for index in range(8)]
+    http_requests += [requests.HttpRequest('http://localhost:%d/slow?%d' % (port, index), send=False)
+                      for index in range(4)]
+    http_requests.insert(3, requests.HttpRequest('http://127.0.0.1:1/refused', send=False))
+    started = time.monotonic()
+    results = requests.map_requests(http_requests, workers=6, per_host=2)
+    elapsed = time.monotonic() - started
+    assert isinstance(results[3], OSError)
+    responses = results[:3] + results[4:]
+    assert [r.content for r in responses[:8]] == [b'/slow?%d' % index for index in range(8)]
+    assert [r.content for r in responses[8:]] == [b'/slow?%d' % index for index in range(4)]
+    assert concurrency_route['peak'] == {'127.0.0.1': 2, 'localhost': 2}
+    assert elapsed < 0.8
+    assert not hasattr(requests, 'map')  # The builtin stays usable inside the module
+
+
+def test_map_requests_shares_session_pool(keep_alive_server, concurrency_route):
+    with requests.Session(max_idle=3) as session:
+        http_requests = [session.prepare(keep_alive_server.url + '/slow?%d' % index) for index in range(12)]
+        results = requests.map_requests(http_requests, workers=3, per_host=3)
+        assert all(r.status == 200 for r in results)
+        assert len(session.pool._idle[http_requests[0].pool_key]) == 3
+    assert len(concurrency_route['ports']) == 3
+
+
+def test_head_response_has_no_body(ranged_image):
+    r = requests.request(ranged_image['url'], method='HEAD')
+    assert r.status == 200
+    assert r.headers['Content-Length'] == str(len(ranged_image['content']))
+    assert r.content == b''
+
+
+def test_download_segmented_fetches_ranges_in_parallel(ranged_image, tmp_path):
+    file_name = str(tmp_path / 'image.bin')
+    r = requests.download_segmented(ranged_image['url'], file_name, segments=4)
+    assert r.status == 200
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == ranged_image['content']
+    assert ranged_image['seen'][0] == ('HEAD', None)
+    assert sorted(ranged_image['seen'][1:]) == [('GET', 'bytes=%d-%d' % (start, start + 256 * 1024 - 1))
+                                                for start in range(0, 1024 * 1024, 256 * 1024)]
+    assert ranged_image['peak'] > 1
+
+
+def test_download_segmented_without_ranges_uses_one_stream(ranged_image, tmp_path):
+    ranged_image['ranges'] = False
+    file_name = str(tmp_path / 'image.bin')
+    requests.download_segmented(ranged_image['url'], file_name, segments=4)
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == ranged_image['content']
+    assert ranged_image['seen'] == [('HEAD', None), ('GET', None)]
+
+
+def test_download_segmented_chunked_ranges(ranged_image, tmp_path):
+    ranged_image['chunked'] = True
+    file_name = str(tmp_path / 'image.bin')
+    requests.download_segmented(ranged_image['url'], file_name, segments=2)
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == ranged_image['content']
+
+
+def test_download_segmented_closes_ranges_on_error(ranged_image, tmp_path, monkeypatch):
+    responses = []
+
+    class RecordedResponse(requests.HttpResponse):
+        def __init__(self, *args, **kw):
+            super().__init__(*args, **kw)
+            responses.append(self)
+
+    def failing_pwrite(fd, data, offset):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(requests, 'HttpResponse', RecordedResponse)
+    monkeypatch.setattr(os, 'pwrite', failing_pwrite)
+    with requests.Session() as session:
+        with pytest.raises(OSError, match='No space'):
+            requests.download_segmented(ranged_image['url'], str(tmp_path / 'image.bin'), segments=2, session=session)
+        assert len(responses) == 3
+        assert all(r._released for r in responses)
+
+
+def test_download_segmented_detects_changed_resource(keep_alive_server, ranged_image, tmp_path):
+    callback = keep_alive_server.routes['/image.bin']
+
+    def publish_after_head(handler, body):
+        response = callback(handler, body)
+        ranged_image['etag'] = '"v2"'
+        return response
+
+    keep_alive_server.add_route('/image.bin', publish_after_head)
+    with pytest.raises(OSError, match='resource may have changed'):
+        requests.download_segmented(ranged_image['url'], str(tmp_path / 'image.bin'))
+
+
+def test_buffer_pool_reuses_buffers():
+    pool = requests.BufferPool(max_free=2)
+    first = pool.take(64)
+    pool.give(first)
+    assert pool.take(64) is first
+    assert pool.take(32) is not first
+    assert (pool.hits, pool.misses) == (1, 2)
+    for size in (1, 2, 3):
+        pool.give(bytearray(size))
+    assert [len(pool.take(size)) for size in (1, 2, 3)] == [1, 2, 3]
+    assert pool.hits == 3
+
+
+def test_repeated_requests_borrow_from_pool(keep_alive_server, tmp_path):
+    file_name = str(tmp_path / 'body.bin')
+    requests.get(keep_alive_server.url + '/echo', save_to_file=file_name)
+    misses = requests.buffer_pool.misses
+    hits = requests.buffer_pool.hits
+    for _ in range(5):
+        requests.get(keep_alive_server.url + '/echo', save_to_file=file_name)
+    assert requests.buffer_pool.misses == misses
+    assert requests.buffer_pool.hits > hits
+
+
+def test_low_memory_caps_buffers(keep_alive_server):
+    requests.low_memory()
+    try:
+        assert (requests.READ_BUFFER_SIZE, requests.WRITE_BUFFER_SIZE, requests.buffer_pool.max_free) == (1024, 536, 2)
+        r = requests.post(keep_alive_server.url + '/echo', data={'value': 'x' * 4000})
+        assert r.json['method'] == 'POST'
+    finally:
+        requests.low_memory(False)
+    assert requests.READ_BUFFER_SIZE == 4096
+
+
+@pytest.fixture
+def micropython_requests(monkeypatch):
+    '''uhttp/requests.py imported down its MicroPython branch, against stub usocket and ussl modules.'''
+    import importlib.util
+    import sys
+    import types
+    monkeypatch.setitem(sys.modules, 'usocket', types.ModuleType('usocket'))
+    monkeypatch.setitem(sys.modules, 'ussl', types.ModuleType('ussl'))
+    monkeypatch.setattr(time, 'ticks_ms', lambda: 0, raising=False)
+    monkeypatch.setattr(time, 'ticks_us', lambda: 0, raising=False)
+    monkeypatch.setattr(time, 'ticks_diff', lambda end, start: end - start, raising=False)
+    spec = importlib.util.spec_from_file_location('uhttp._micropython_requests', requests.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.usocket is sys.modules['usocket']
+    return module
+
+
+class StubSocket:
+    def __init__(self):
+        self.written = bytearray()
+        self.closed = 0
+
+    def write(self, data):
+        self.written += data
+
+    def close(self):
+        self.closed += 1
+
+
+def test_micropython_socket_interface_returns_buffer_once(micropython_requests):
+    pool = micropython_requests.buffer_pool
+    sock = StubSocket()
+    interface = micropython_requests.SocketInterface(sock)
+    interface.write(b'GET / HTTP/1.1\r\n\r\n')
+    interface.flush()
+    assert sock.written == b'GET / HTTP/1.1\r\n\r\n'
+    interface.close()
+    interface.close()
+    assert sock.closed == 2
+    first, second = pool.take(micropython_requests.WRITE_BUFFER_SIZE), pool.take(
+        micropython_requests.WRITE_BUFFER_SIZE)
+    assert first is not second
+    assert (pool.hits, pool.misses) == (1, 2)
+
+
+def test_body_shorter_than_content_length_raises(raw_server):
+    raw_server['response'] = b'HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n' + b'x' * 10
+    with requests.Session() as session:
+        with pytest.raises(OSError, match='full body'):
+            session.get(raw_server['url'] + '/short')
+        assert not any(session.pool._idle.values())
+
+
+def test_body_read_until_close(raw_server, tmp_path):
+    raw_server['response'] = b'HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n\r\n{"interval": 30}'
+    assert requests.get(raw_server['url'] + '/unframed').json == {'interval': 30}
+    file_name = str(tmp_path / 'unframed.json')
+    requests.get(raw_server['url'] + '/unframed', save_to_file=file_name)
+    with open(file_name, 'rb') as reader:
+        assert reader.read() == b'{"interval": 30}'
@@ -0,0 +1,194 @@
+'''
+asyncio / uasyncio counterpart of uhttp.requests.
+
+Requests are built with the same body classes and parsed by the same HttpResponse as the blocking client, only the
+socket I/O is awaited, so many requests can run concurrently on one event loop.
+
+Example:
+    from uhttp import aio
+
+    r1, r2 = await asyncio.gather(aio.get(url_1), aio.post(url_2, json={'temperature': 21.5}))
+
+Notes:
+    The response is received into memory before it is parsed, and request bodies are queued on the stream writer
+    before it is drained. Use the blocking client for transfers larger than free memory.
+'''
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import io
+
+from .requests import (ENCODING, READ_BUFFER_SIZE, HttpRequest, HttpResponse, _check_range, _preallocate,
+                       _range_headers, _segment_ranges, build_body, tls_cache)
+
+
+class StreamSocket:
+    '''
+    Gives an asyncio StreamWriter the write interface the body classes send through.
+    '''
+
+    def __init__(self, writer):
+        self._writer = writer
+        self.bytes_sent = 0
+
+    def write(self, data: bytes):
+        # Bodies reuse their blocks, so the writer gets its own copy to queue.
+        self._writer.write(bytes(data))
+        self.bytes_sent += len(data)
+
+    def flush(self):
+        pass
+
+
+async def _read_head(reader) -> bytearray:
+    raw = bytearray(await reader.readline())
+    if not raw:
+        raise OSError('Connection closed before a response was received.')
+    while True:
+        line = await reader.readline()
+        raw += line
+        if not line or line == b'\r\n':
+            return raw
+
+
+async def _read_response(reader, head: bool = False) -> bytearray:
+    raw = await _read_head(reader)
+    status = raw.split(b' ', 2)[1]
+    content_length = None
+    chunked = False
+    for line in raw.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            content_length = int(value)
+        elif name == b'transfer-encoding':
+            chunked = value.strip().lower() == b'chunked'
+    if head or status in (b'204', b'304') or status.startswith(b'1'):
+        return raw
+    if chunked:
+        # Only the framing is followed here, HttpResponse decodes the chunks.
+        while True:
+            line = await reader.readline()
+            raw += line
+            size = int(line.split(b';', 1)[0].strip().decode(ENCODING), 16)
+            if not size:
+                break
+            raw += await reader.readexactly(size + 2)
+        while True:
+            line = await reader.readline()
+            raw += line
+            if not line or line == b'\r\n':
+                break
+    elif content_length is not None:
+        raw += await reader.readexactly(content_length)
+    else:
+        raw += await reader.read(-1)
+    return raw
+
+
+async def _open(http_request: HttpRequest):
+    host, port = http_request._host.decode(ENCODING), http_request._port
+    # asyncio cannot resume TLS sessions, but the per-host context is still shared with the blocking client.
+    ssl = (tls_cache.context(host) or True) if http_request._proto == b'https:' else None
+    reader, writer = await asyncio.open_connection(host, port, ssl=ssl)
+    # open_connection resolves, connects and handshakes in one step, it is all recorded as the connect phase.
+    http_request._mark('connect')
+    try:
+        http_request.write_to(StreamSocket(writer))
+        await writer.drain()
+    except BaseException:
+        await _close(writer)
+        raise
+    return reader, writer
+
+
+async def _close(writer):
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _exchange(http_request: HttpRequest, save_to_file: str = None, decompress: bool = False) -> HttpResponse:
+    head = http_request._method == b'HEAD'
+    reader, writer = await _open(http_request)
+    try:
+        raw = await _read_response(reader, head=head)
+    finally:
+        await _close(writer)
+    http_request.timings.bytes_received = len(raw)
+    return HttpResponse(io.BytesIO(raw), save_to_file=save_to_file, decompress=decompress,
+                        timings=http_request.timings, hooks=http_request._hooks, head=head)
+
+
+async def request(url: str, port: int = None, method: str = 'GET', data=None, json=None, file=None,
+                  custom_headers=None, save_to_file: str = None, chunked=False, chunk_size=512, timeout=None,
+                  decompress=False, compress=None):
+    http_body = build_body(data=data, json=json, file=file, chunked=chunked, chunk_size=chunk_size, compress=compress)
+    http_request = HttpRequest(url, port=port, custom_headers=custom_headers, method=method, body=http_body,
+                               send=False, decompress=decompress)
+    exchange = _exchange(http_request, save_to_file=save_to_file, decompress=decompress)
+    if timeout is None:
+        return await exchange
+    return await asyncio.wait_for(exchange, timeout)
+
+
+async def get(url, **kw):
+    return await request(url, method='GET', **kw)
+
+
+async def post(url, **kw):
+    return await request(url, method='POST', **kw)
+
+
+async def put(url, **kw):
+    return await request(url, method='PUT', **kw)
+
+
+async def patch(url, **kw):
+    return await request(url, method='PATCH', **kw)
+
+
+async def delete(url, **kw):
+    return await request(url, method='DELETE', **kw)
+
+
+async def _fetch_range(url: str, writer_file, start: int, end: int, port, custom_headers, validator):
+    http_request = HttpRequest(url, port=port, custom_headers=_range_headers(custom_headers, start, end, validator),
+                               send=False)
+    reader, writer = await _open(http_request)
+    try:
+        r = HttpResponse(io.BytesIO(await _read_head(reader)), head=True)
+        _check_range(r, start)
+        if r.headers.get('Transfer-Encoding', 'identity').lower() != 'identity':
+            # The body is copied to the file as it arrives, framing and all.
+            raise OSError(f'Range {start}-{end} was sent with Transfer-Encoding: {r.headers["Transfer-Encoding"]}.')
+        offset = start
+        while offset <= end:
+            data = await reader.read(min(end + 1 - offset, READ_BUFFER_SIZE))
+            if not data:
+                raise OSError(f'Range {start}-{end} ended after {offset - start} bytes.')
+            # No await between seek and write, so the segments never interleave on the shared file.
+            writer_file.seek(offset)
+            writer_file.write(data)
+            offset += len(data)
+    finally:
+        await _close(writer)
+
+
+async def download_segmented(url: str, file_name: str, segments: int = 4, port: int = None, custom_headers=None):
+    '''
+    Cooperative counterpart of uhttp.requests.download_segmented: the ranges are fetched concurrently on the event loop
+    and written at their offsets through one file, so it also runs on uasyncio. Without Accept-Ranges the body is
+    fetched in a single request, and held in memory like any other aio response.
+    Returns the HEAD response, or the response of the single request.
+    '''
+    head = await request(url, port=port, method='HEAD', custom_headers=custom_headers)
+    ranges = _segment_ranges(head, segments)
+    if ranges is None:
+        return await request(url, port=port, custom_headers=custom_headers, save_to_file=file_name)
+    validator = head.headers.get('ETag') or head.headers.get('Last-Modified')
+    _preallocate(file_name, ranges[-1][1] + 1)
+    with open(file_name, 'r+b') as writer_file:
+        await asyncio.gather(*[_fetch_range(url, writer_file, start, end, port, custom_headers, validator)
+                               for start, end in ranges])
+    return head
@@ -0,0 +1,270 @@
+'''
+On-disk cache for GET responses, honouring Cache-Control / Expires freshness and revalidating stale entries.
+
+Example:
+    from uhttp import requests
+    from uhttp.cache import HttpCache
+
+    cache = HttpCache('/http_cache', max_bytes=64 * 1024)
+    r = requests.get(url, cache=cache)     # or Session(cache=cache)
+    print(r.from_cache)                    # False, 'hit' or 'revalidated'
+
+Notes:
+    Each entry is two files: <key>.http holds the response as it came off the wire, with a Content-Length, and is
+    parsed by HttpResponse straight from the file. <key>.meta holds the freshness and validators. A 304 only rewrites
+    the small .meta file.
+
+    The key is the URL together with the Accept, Accept-Language and Accept-Encoding request headers and the
+    decompress flag, since those pick which representation comes back. Requests with an Authorization or Cookie
+    header are answered for one user, they bypass the cache and are neither served from it nor stored.
+
+    Entries are evicted least recently used first once max_bytes is exceeded. To spare flash, a cache hit only
+    reorders the in-memory list. The order is written to the index file together with writes that happen anyway,
+    when an entry is stored or evicted.
+'''
+import json
+import os
+from time import time
+
+from .requests import ENCODING, HttpResponse
+
+_MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+# Hop-by-hop and framing fields that are rewritten when a response is stored.
+_SKIPPED_HEADERS = ('connection', 'keep-alive', 'transfer-encoding', 'content-length')
+# Request fields that select the representation returned, they are part of the key.
+_KEYED_HEADERS = ('accept', 'accept-encoding', 'accept-language')
+# Request fields that make the response specific to one user.
+_PRIVATE_HEADERS = ('authorization', 'cookie')
+
+
+def _days_from_civil(year: int, month: int, day: int) -> int:
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_http_date(value: str):
+    '''
+    Seconds since 1970 for an IMF-fixdate such as 'Sun, 06 Nov 1994 08:49:37 GMT', None if it does not parse.
+    '''
+    try:
+        _, day, month, year, clock = value.split()[:5]
+        hours, minutes, seconds = clock.split(':')
+        days = _days_from_civil(int(year), _MONTHS.index(month.lower()) + 1, int(day))
+        return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _cache_control(headers) -> dict:
+    directives = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+
+def freshness_lifetime(headers) -> int:
+    '''
+    Seconds the response may be served without revalidation: max-age less Age, else Expires less Date, else 0.
+    '''
+    directives = _cache_control(headers)
+    if 'no-cache' in directives:
+        return 0
+    try:
+        if 'max-age' in directives:
+            return max(0, int(directives['max-age']) - int(headers.get('Age', '0')))
+    except ValueError:
+        return 0
+    expires, date = parse_http_date(headers.get('Expires')), parse_http_date(headers.get('Date'))
+    if expires is None or date is None:
+        return 0
+    return max(0, expires - date)
+
+
+class HttpCache:
+    '''
+    Stores GET responses in directory and serves them while fresh. Stale entries are revalidated with
+    If-None-Match / If-Modified-Since, and a 304 serves the stored body. At most max_bytes are kept.
+    '''
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024):
+        self.directory = directory.rstrip('/')
+        self.max_bytes = max_bytes
+        self._sizes = None
+        self._order = None
+
+    def _path(self, key: str, ext: str) -> str:
+        return f'{self.directory}/{key}.{ext}'
+
+    @staticmethod
+    def key(url: str, custom_headers: dict = None, decompress: bool = False) -> str:
+        import binascii
+        import hashlib
+        material = url
+        if custom_headers:
+            fields = sorted((name.lower(), str(value)) for name, value in custom_headers.items())
+            material += ''.join(f'\n{name}: {value}' for name, value in fields if name in _KEYED_HEADERS)
+        if decompress:
+            material += '\ndecompress'
+        return binascii.hexlify(hashlib.sha256(material.encode(ENCODING)).digest()[:8]).decode()
+
+    @staticmethod
+    def _private(custom_headers) -> bool:
+        return bool(custom_headers) and any(name.lower() in _PRIVATE_HEADERS for name in custom_headers)
+
+    def _load_index(self):
+        if self._order is not None:
+            return
+        self._sizes, self._order = {}, []
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass
+        try:
+            with open(self._path('index', 'txt')) as reader:
+                for line in reader:
+                    key, _, size = line.strip().partition(' ')
+                    if key and key not in self._sizes:
+                        self._sizes[key] = int(size)
+                        self._order.append(key)
+        except (OSError, ValueError):
+            pass
+
+    def _save_index(self):
+        with open(self._path('index', 'tmp'), 'w') as writer:
+            for key in self._order:
+                writer.write(f'{key} {self._sizes[key]}\n')
+        self._replace(self._path('index', 'tmp'), self._path('index', 'txt'))
+
+    @staticmethod
+    def _replace(source: str, target: str):
+        # rename() does not overwrite on every filesystem MicroPython mounts.
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        os.rename(source, target)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _touch(self, key: str):
+        if key in self._sizes:
+            self._order.remove(key)
+            self._order.append(key)
+
+    def _read_meta(self, key: str):
+        if key not in self._sizes:
+            return None
+        try:
+            with open(self._path(key, 'meta')) as reader:
+                return json.loads(reader.read())
+        except (OSError, ValueError):
+            self._evict(key)
+            return None
+
+    def _write_meta(self, key: str, meta: dict):
+        with open(self._path(key, 'tmp'), 'w') as writer:
+            writer.write(json.dumps(meta))
+        self._replace(self._path(key, 'tmp'), self._path(key, 'meta'))
+
+    def _evict(self, key: str):
+        self._remove(self._path(key, 'http'))
+        self._remove(self._path(key, 'meta'))
+        if key in self._sizes:
+            del self._sizes[key]
+            self._order.remove(key)
+
+    def _open(self, key: str, from_cache: str) -> HttpResponse:
+        r = HttpResponse(open(self._path(key, 'http'), 'rb'))
+        r.from_cache = from_cache
+        return r
+
+    @staticmethod
+    def _validators(headers) -> dict:
+        return {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+
+    def _store(self, key: str, r: HttpResponse, now: float, decompressed: bool):
+        directives = _cache_control(r.headers)
+        vary = r.headers.get('Vary', '').lower().replace('accept-encoding', '').strip(', ')
+        content = getattr(r, '_content', None)
+        meta = self._validators(r.headers)
+        meta['expires'] = now + freshness_lifetime(r.headers)
+        # A response that could neither be served fresh nor revalidated is not worth the flash it takes.
+        useless = meta['expires'] <= now and meta['etag'] is None and meta['last_modified'] is None
+        stored_body = isinstance(content, (bytes, bytearray))
+        if 'no-store' in directives or vary or r.status != 200 or not stored_body or useless:
+            if key in self._sizes:
+                self._evict(key)
+                self._save_index()
+            return
+        with open(self._path(key, 'tmp'), 'wb') as writer:
+            writer.write(b'HTTP/1.1 200 OK\r\n')
+            for name, value in r.headers.items():
+                lowered = name.lower()
+                if lowered in _SKIPPED_HEADERS or (decompressed and lowered == 'content-encoding'):
+                    continue
+                writer.write(f'{name}: {value}\r\n'.encode(ENCODING))
+            writer.write(b'Content-Length: %d\r\n\r\n' % len(content))
+            writer.write(content)
+        size = os.stat(self._path(key, 'tmp'))[6]
+        if size > self.max_bytes:
+            self._remove(self._path(key, 'tmp'))
+            self._evict(key)
+            self._save_index()
+            return
+        self._evict(key)
+        self._replace(self._path(key, 'tmp'), self._path(key, 'http'))
+        self._write_meta(key, meta)
+        self._sizes[key] = size
+        self._order.append(key)
+        while sum(self._sizes.values()) > self.max_bytes:
+            self._evict(self._order[0])
+        self._save_index()
+
+    def fetch(self, url: str, send, custom_headers: dict = None, decompress: bool = False) -> HttpResponse:
+        '''
+        Returns a fresh stored response for url, or calls send(headers) with the validators added and stores or
+        revalidates with what comes back. Requests with credentials are passed to send untouched.
+        '''
+        if self._private(custom_headers):
+            return send(custom_headers)
+        self._load_index()
+        key = self.key(url, custom_headers, decompress)
+        meta = self._read_meta(key)
+        now = time()
+        if meta is not None and meta['expires'] > now:
+            self._touch(key)
+            return self._open(key, 'hit')
+        headers = {} if custom_headers is None else dict(custom_headers)
+        if meta is not None:
+            if meta['etag'] is not None:
+                headers['If-None-Match'] = meta['etag']
+            if meta['last_modified'] is not None:
+                headers['If-Modified-Since'] = meta['last_modified']
+        r = send(headers)
+        if r.status == 304 and meta is not None:
+            validators = self._validators(r.headers)
+            meta['etag'] = validators['etag'] or meta['etag']
+            meta['last_modified'] = validators['last_modified'] or meta['last_modified']
+            meta['expires'] = now + freshness_lifetime(r.headers)
+            self._write_meta(key, meta)
+            self._touch(key)
+            return self._open(key, 'revalidated')
+        self._store(key, r, now, decompress)
+        return r
+
+    def clear(self):
+        self._load_index()
+        for key in list(self._order):
+            self._evict(key)
+        self._save_index()
@@ -0,0 +1,190 @@
+'''
+Streaming JSON encoding and incremental JSON decoding.
+
+Documents are written and read a piece at a time, so a request or response body never has to be held in memory as a
+whole.
+
+Example:
+    from uhttp import requests, json_stream
+
+    r = requests.post(url, json=shadow, chunked=True)
+
+    with requests.get(url, stream=True) as r:
+        for reading in r.iter_json('state.reported.readings.item'):
+            print(reading['value'])
+
+Notes:
+    The decoder yields ijson style (prefix, event, value) tuples. The prefix is the dotted path of the value, with
+    'item' standing for any array element. Separators are not validated, the decoder trusts the server to send
+    well formed JSON.
+'''
+import json
+
+# Tuples of ints, MicroPython only looks for buffers in bytes, so `byte in b'...'` raises TypeError there.
+_WHITESPACE = tuple(b' \t\r\n')
+_NUMBER = tuple(b'+-0123456789.eE')
+_LITERALS = {ord('t'): (b'rue', 'boolean', True), ord('f'): (b'alse', 'boolean', False),
+             ord('n'): (b'ull', 'null', None)}
+_MAP = 0
+_ARRAY = 1
+
+
+def iterencode(obj):
+    '''
+    Yields obj as JSON text in small str pieces, one per scalar, key or bracket.
+    '''
+    if isinstance(obj, dict):
+        separator = '{'
+        for key, value in obj.items():
+            yield separator + json.dumps(str(key)) + ':'
+            separator = ','
+            yield from iterencode(value)
+        yield '{}' if separator == '{' else '}'
+    elif isinstance(obj, (list, tuple)):
+        separator = '['
+        for value in obj:
+            yield separator
+            separator = ','
+            yield from iterencode(value)
+        yield '[]' if separator == '[' else ']'
+    else:
+        yield json.dumps(obj)
+
+
+def _join(prefix: str, name: str) -> str:
+    return name if not prefix else prefix + '.' + name
+
+
+class JsonEvents:
+    '''
+    Incremental JSON tokenizer over an iterable of bytes chunks, such as HttpResponse.iter_content().
+    '''
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b''
+        self._pos = 0
+
+    def _byte(self):
+        while self._pos >= len(self._buf):
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return None
+            self._pos = 0
+        byte = self._buf[self._pos]
+        self._pos += 1
+        return byte
+
+    def _token_start(self):
+        while True:
+            byte = self._byte()
+            if byte is None or byte not in _WHITESPACE:
+                return byte
+
+    def _string(self) -> str:
+        raw = bytearray()
+        escaped = False
+        while True:
+            byte = self._byte()
+            if byte is None:
+                raise ValueError('Unterminated JSON string.')
+            if byte == 0x22 and not escaped:
+                break
+            escaped = byte == 0x5c and not escaped
+            raw.append(byte)
+        if 0x5c in raw:
+            return json.loads('"' + raw.decode('utf-8') + '"')
+        return raw.decode('utf-8')
+
+    def _number(self, first: int):
+        raw = bytearray((first,))
+        while True:
+            byte = self._byte()
+            if byte is None:
+                break
+            if byte not in _NUMBER:
+                self._pos -= 1
+                break
+            raw.append(byte)
+        text = raw.decode('utf-8')
+        if '.' in text or 'e' in text or 'E' in text:
+            return float(text)
+        return int(text)
+
+    def _literal(self, first: int):
+        rest, event, value = _LITERALS[first]
+        for expected in rest:
+            if self._byte() != expected:
+                raise ValueError('Invalid JSON literal.')
+        return event, value
+
+    def __iter__(self):
+        containers = []
+        prefix = ''
+        expect_key = False
+        while True:
+            byte = self._token_start()
+            if byte is None:
+                if containers:
+                    raise ValueError('JSON document ended early.')
+                return
+            if byte == 0x2c:
+                expect_key = containers[-1][0] == _MAP
+            elif byte == 0x3a:
+                continue
+            elif byte == 0x7b:
+                yield prefix, 'start_map', None
+                containers.append((_MAP, prefix))
+                expect_key = True
+            elif byte == 0x5b:
+                yield prefix, 'start_array', None
+                containers.append((_ARRAY, prefix))
+                prefix = _join(prefix, 'item')
+            elif byte == 0x7d or byte == 0x5d:
+                kind, prefix = containers.pop()
+                yield prefix, 'end_map' if kind == _MAP else 'end_array', None
+                expect_key = False
+            elif byte == 0x22:
+                value = self._string()
+                if expect_key:
+                    yield containers[-1][1], 'map_key', value
+                    prefix = _join(containers[-1][1], value)
+                    expect_key = False
+                else:
+                    yield prefix, 'string', value
+            elif byte in _LITERALS:
+                event, value = self._literal(byte)
+                yield prefix, event, value
+            elif byte in _NUMBER:
+                yield prefix, 'number', self._number(byte)
+            else:
+                raise ValueError(f'Unexpected byte in JSON: {chr(byte)}')
+
+
+def _build(event: str, value, events):
+    if event == 'start_map':
+        obj = {}
+        for _, event, key in events:
+            if event == 'end_map':
+                return obj
+            _, event, value = next(events)
+            obj[key] = _build(event, value, events)
+    elif event == 'start_array':
+        array = []
+        for _, event, value in events:
+            if event == 'end_array':
+                return array
+            array.append(_build(event, value, events))
+    return value
+
+
+def items(chunks, prefix: str):
+    '''
+    Yields every value found at prefix, built into Python objects one at a time. Everything else is skipped without
+    being built.
+    '''
+    events = iter(JsonEvents(chunks))
+    for current, event, value in events:
+        if current == prefix and event not in ('map_key', 'end_map', 'end_array'):
+            yield _build(event, value, events)
@@ -0,0 +1,121 @@
+'''
+MIME types for file uploads, looked up by file extension.
+
+The table is one string with a line per type, listing that type's extensions. It is only imported by the file and
+multipart bodies, and a lookup is a substring search, so no dict is built unless types_map is asked for.
+'''
+_TABLE = (
+    'application/javascript .js .mjs \n'
+    'application/json .json \n'
+    'application/manifest+json .webmanifest \n'
+    'application/msword .doc .dot .wiz \n'
+    'application/octet-stream .bin .a .dll .exe .o .obj .so \n'
+    'application/oda .oda \n'
+    'application/pdf .pdf \n'
+    'application/pkcs7-mime .p7c \n'
+    'application/postscript .ps .ai .eps \n'
+    'application/vnd.apple.mpegurl .m3u .m3u8 \n'
+    'application/vnd.ms-excel .xls .xlb \n'
+    'application/vnd.ms-powerpoint .ppt .pot .ppa .pps .pwz \n'
+    'application/wasm .wasm \n'
+    'application/x-bcpio .bcpio \n'
+    'application/x-cpio .cpio \n'
+    'application/x-csh .csh \n'
+    'application/x-dvi .dvi \n'
+    'application/x-gtar .gtar \n'
+    'application/x-hdf .hdf \n'
+    'application/x-hdf5 .h5 \n'
+    'application/x-latex .latex \n'
+    'application/x-mif .mif \n'
+    'application/x-netcdf .cdf .nc \n'
+    'application/x-pkcs12 .p12 .pfx \n'
+    'application/x-pn-realaudio .ram \n'
+    'application/x-python-code .pyc .pyo \n'
+    'application/x-sh .sh \n'
+    'application/x-shar .shar \n'
+    'application/x-shockwave-flash .swf \n'
+    'application/x-sv4cpio .sv4cpio \n'
+    'application/x-sv4crc .sv4crc \n'
+    'application/x-tar .tar \n'
+    'application/x-tcl .tcl \n'
+    'application/x-tex .tex \n'
+    'application/x-texinfo .texi .texinfo \n'
+    'application/x-troff .roff .t .tr \n'
+    'application/x-troff-man .man \n'
+    'application/x-troff-me .me \n'
+    'application/x-troff-ms .ms \n'
+    'application/x-ustar .ustar \n'
+    'application/x-wais-source .src \n'
+    'application/xml .xsl .rdf .wsdl .xpdl \n'
+    'application/zip .zip \n'
+    'audio/3gpp .3gp .3gpp \n'
+    'audio/3gpp2 .3g2 .3gpp2 \n'
+    'audio/aac .aac .adts .loas .ass \n'
+    'audio/basic .au .snd \n'
+    'audio/mpeg .mp3 .mp2 \n'
+    'audio/opus .opus \n'
+    'audio/x-aiff .aif .aifc .aiff \n'
+    'audio/x-pn-realaudio .ra \n'
+    'audio/x-wav .wav \n'
+    'image/bmp .bmp \n'
+    'image/gif .gif \n'
+    'image/ief .ief \n'
+    'image/jpeg .jpg .jpe .jpeg \n'
+    'image/heic .heic \n'
+    'image/heif .heif \n'
+    'image/png .png \n'
+    'image/svg+xml .svg \n'
+    'image/tiff .tiff .tif \n'
+    'image/vnd.microsoft.icon .ico \n'
+    'image/x-cmu-raster .ras \n'
+    'image/x-portable-anymap .pnm \n'
+    'image/x-portable-bitmap .pbm \n'
+    'image/x-portable-graymap .pgm \n'
+    'image/x-portable-pixmap .ppm \n'
+    'image/x-rgb .rgb \n'
+    'image/x-xbitmap .xbm \n'
+    'image/x-xpixmap .xpm \n'
+    'image/x-xwindowdump .xwd \n'
+    'message/rfc822 .eml .mht .mhtml .nws \n'
+    'text/css .css \n'
+    'text/csv .csv \n'
+    'text/html .html .htm \n'
+    'text/plain .txt .bat .c .h .ksh .pl \n'
+    'text/richtext .rtx \n'
+    'text/tab-separated-values .tsv \n'
+    'text/x-python .py \n'
+    'text/x-setext .etx \n'
+    'text/x-sgml .sgm .sgml \n'
+    'text/x-vcard .vcf \n'
+    'text/xml .xml \n'
+    'video/mp4 .mp4 \n'
+    'video/mpeg .mpeg .m1v .mpa .mpe .mpg \n'
+    'video/quicktime .mov .qt \n'
+    'video/webm .webm \n'
+    'video/x-msvideo .avi \n'
+    'video/x-sgi-movie .movie \n'
+)
+
+
+def guess_type(ext: str, default: str = None) -> str:
+    '''
+    Returns the MIME type for an extension such as '.png', or default when it is not known.
+    '''
+    index = _TABLE.find(' ' + ext.lower() + ' ') if ext else -1
+    if index < 0:
+        return default
+    start = _TABLE.rfind('\n', 0, index) + 1
+    return _TABLE[start:_TABLE.index(' ', start)]
+
+
+def build_types_map() -> dict:
+    '''
+    Expands the table into an {extension: type} dict.
+    '''
+    types_map = {}
+    for line in _TABLE.split('\n'):
+        if line:
+            content_type, *extensions = line.split()
+            for ext in extensions:
+                types_map[ext] = content_type
+    return types_map
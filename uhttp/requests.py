@@ -1,214 +1,579 @@
-import gc
+import os
 
-gc.collect()
 ENCODING = 'utf-8'
+READ_BUFFER_SIZE = 4096
+BLOCK_SIZE = 1024
+WRITE_BUFFER_SIZE = 1460  # One TCP segment on Ethernet
+SOCKET_TIMEOUT = 2
 try:
-    print('Running MicroPython')
+    from _thread import allocate_lock
+except ImportError:
+    class _NoLock:
+        '''Stands in for a lock on ports built without threads.'''
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+
+    def allocate_lock():
+        return _NoLock()
+
+
+class BufferPool:
+    '''
+    Lends out bytearrays and keeps the ones given back for the next borrower of the same size, so a long running
+    device reuses a few buffers instead of allocating new ones for every request and fragmenting its heap.
+
+    At most max_free buffers are kept. hits and misses count the takes served from the pool and the ones that had to
+    allocate.
+    '''
+
+    def __init__(self, max_free: int = 4):
+        self.max_free = max_free
+        self.hits = 0
+        self.misses = 0
+        self._free = []
+        self._lock = allocate_lock()
+
+    def take(self, size: int) -> bytearray:
+        with self._lock:
+            for index, buff in enumerate(self._free):
+                if len(buff) == size:
+                    self.hits += 1
+                    return self._free.pop(index)
+            self.misses += 1
+        return bytearray(size)
+
+    def give(self, buff: bytearray):
+        '''
+        Returns buff to the pool. The caller must not touch it, or a view of it, afterwards.
+        '''
+        with self._lock:
+            self._free.append(buff)
+            if len(self._free) > self.max_free:
+                # The oldest is the least likely to be asked for again.
+                del self._free[0]
+
+    def clear(self):
+        with self._lock:
+            self._free = []
+
+
+buffer_pool = BufferPool()
+_DEFAULT_SIZES = READ_BUFFER_SIZE, BLOCK_SIZE, WRITE_BUFFER_SIZE, buffer_pool.max_free
+_LOW_MEMORY_SIZES = 1024, 512, 536, 2  # 536 bytes is the smallest segment every IPv4 host must accept
+
+
+def low_memory(enabled: bool = True):
+    '''
+    Caps the buffers for a small heap: 1024 byte reads, 512 byte file blocks and 536 byte coalesced writes, with at
+    most 2 kept in the pool. low_memory(False) restores the defaults. Connections already open keep their buffers.
+    '''
+    global READ_BUFFER_SIZE, BLOCK_SIZE, WRITE_BUFFER_SIZE
+    READ_BUFFER_SIZE, BLOCK_SIZE, WRITE_BUFFER_SIZE, buffer_pool.max_free = \
+        _LOW_MEMORY_SIZES if enabled else _DEFAULT_SIZES
+    # Buffers of the previous sizes would never be taken again.
+    buffer_pool.clear()
+
+
+try:
+    import io
     import usocket
+    import errno
     import ussl
+    from time import ticks_ms, ticks_us, ticks_diff
+
+
+    def _timed_out(e: OSError) -> bool:
+        return e.args[:1] == (errno.ETIMEDOUT,)
+
+
+    def _tls_context():
+        if not hasattr(ussl, 'SSLContext'):
+            return None  # Older firmware only provides ussl.wrap_socket
+        context = ussl.SSLContext(ussl.PROTOCOL_TLS_CLIENT)
+        context.verify_mode = ussl.CERT_NONE  # Same as ussl.wrap_socket
+        return context
+
+
+    def _tls_wrap(context, sock, host, session=None):
+        if context is None:
+            return ussl.wrap_socket(sock, server_hostname=host)
+        return context.wrap_socket(sock, server_hostname=host)
+
+
+    ATTEMPT_TIMEOUT = 1
+
+
+    def _open_connection(address_infos: list, timeout):
+        '''
+        Tries each address in turn. All but the last get ATTEMPT_TIMEOUT, so an address on a broken route does not
+        use up the whole timeout.
+        '''
+        error = None
+        for index, address_info in enumerate(address_infos):
+            sock = usocket.socket(address_info[0], address_info[1], address_info[2])
+            sock.settimeout(timeout if index == len(address_infos) - 1 else min(timeout, ATTEMPT_TIMEOUT))
+            try:
+                sock.connect(address_info[-1])
+            except OSError as e:
+                sock.close()
+                error = e
+                continue
+            sock.settimeout(timeout)
+            return sock, address_info
+        raise error
+
+
+    class _RawBody(io.IOBase):
+        def __init__(self, read_raw):
+            self._read_raw = read_raw
+
+        def readinto(self, buff):
+            return self._read_raw(buff)
+
+
+    class _Inflater:
+        '''
+        Decompresses a gzip or deflate body read through read_raw, using the deflate module where available and
+        uzlib on older firmware.
+        '''
+
+        def __init__(self, read_raw, content_encoding: str):
+            gzip = content_encoding == 'gzip'
+            self._read_raw = read_raw
+            try:
+                import deflate
+                self._stream = deflate.DeflateIO(_RawBody(read_raw), deflate.GZIP if gzip else deflate.ZLIB)
+            except ImportError:
+                import uzlib
+                self._stream = uzlib.DecompIO(_RawBody(read_raw), 31 if gzip else 15)
+
+        def readinto(self, buff) -> int:
+            view = memoryview(buff)
+            read = 0
+            while read < len(view):
+                count = self._stream.readinto(view[read:])
+                if not count:
+                    # Consume the end of the framing (e.g. the last chunk) so the connection can be reused.
+                    while self._read_raw(bytearray(16)):
+                        pass
+                    break
+                read += count
+            return read
+
+        def close(self):
+            pass  # The deflate module owns its buffers, nothing was borrowed from the pool.
+
+
+    class _Sink(io.IOBase):
+        def __init__(self):
+            self.parts = []
+
+        def write(self, data):
+            self.parts.append(bytes(data))
+            return len(data)
+
+
+    class _Deflater:
+        '''
+        Compresses a body into gzip or zlib wrapped deflate with the deflate module.
+        '''
+
+        def __init__(self, content_encoding: str):
+            import deflate
+            self._sink = _Sink()
+            self._stream = deflate.DeflateIO(self._sink, deflate.GZIP if content_encoding == 'gzip' else deflate.ZLIB)
+
+        def _take(self) -> bytes:
+            data = b''.join(self._sink.parts)
+            self._sink.parts = []
+            return data
+
+        def compress(self, data) -> bytes:
+            self._stream.write(data)
+            return self._take()
+
+        def flush(self) -> bytes:
+            self._stream.close()
+            return self._take()
 
 
     class SocketInterface:
-        def __init__(self, sock):
+        def __init__(self, sock, on_close=None):
             self._sock = sock
+            self._on_close = on_close
+            self.tls_resumed = False
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self._wbuff = buffer_pool.take(WRITE_BUFFER_SIZE)
+            self._wview = memoryview(self._wbuff)
+            self._wlen = 0
 
         def settimeout(self, value):
             return self._sock.settimeout(value)
 
         def write(self, data: bytes):
-            # print(data)
+            # Small writes are coalesced so the request head and small bodies leave in a single segment.
+            size = len(data)
+            self.bytes_sent += size
+            if self._wlen + size <= len(self._wbuff):
+                self._wview[self._wlen:self._wlen + size] = data
+                self._wlen += size
+                return
+            self.flush()
             self._sock.write(data)
 
+        def flush(self):
+            if self._wlen:
+                self._sock.write(self._wview[:self._wlen])
+                self._wlen = 0
+
         def read(self, size=None):
-            return self._sock.read() if size is None else self._sock.read(size)
+            data = self._sock.read() if size is None else self._sock.read(size)
+            self.bytes_received += len(data)
+            return data
+
+        def readinto(self, buff) -> int:
+            view = memoryview(buff)
+            read = 0
+            while read < len(view):
+                received = self._sock.readinto(view[read:])
+                if not received:
+                    break
+                read += received
+            self.bytes_received += read
+            return read
 
         def readline(self):
-            return self._sock.readline()
+            line = self._sock.readline()
+            self.bytes_received += len(line)
+            return line
 
         def close(self):
+            if self._on_close is not None:
+                self._on_close(self._sock)
             self._sock.close()
+            if self._wbuff is not None:
+                buffer_pool.give(self._wbuff)
+                self._wbuff = self._wview = None
 
 except ModuleNotFoundError as e:
-    print('Base Python Implementation')
     import socket as usocket
     import ssl
 
-    ussl = ssl.create_default_context()
+    from time import monotonic
+
+
+    def _timed_out(e: OSError) -> bool:
+        return isinstance(e, (TimeoutError, usocket.timeout))
+
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+
+    def ticks_us():
+        return int(monotonic() * 1000000)
+
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+    def _tls_context():
+        return ssl.create_default_context()
+
+
+    def _tls_wrap(context, sock, host, session=None):
+        return context.wrap_socket(sock, server_hostname=host, session=session)
+
+
+    ATTEMPT_DELAY = 0.25  # RFC 8305 Connection Attempt Delay
+
+
+    def _open_connection(address_infos: list, timeout):
+        '''
+        Happy Eyeballs (RFC 8305): starts a non-blocking connect to the next address every ATTEMPT_DELAY seconds, or
+        as soon as an attempt fails. The first connection to complete wins and the rest are closed. Each attempt
+        times out on its own after timeout seconds.
+        '''
+        import select
+        remaining = list(address_infos)
+        pending = {}
+        error = None
+        try:
+            while remaining or pending:
+                if remaining:
+                    address_info = remaining.pop(0)
+                    sock = usocket.socket(address_info[0], address_info[1], address_info[2])
+                    sock.setblocking(False)
+                    try:
+                        sock.connect(address_info[-1])
+                    except BlockingIOError:
+                        pass
+                    except OSError as e:
+                        sock.close()
+                        error = e
+                        continue
+                    pending[sock] = (address_info, monotonic() + timeout)
+                now = monotonic()
+                wait = max(0, min(deadline for _, deadline in pending.values()) - now)
+                _, writable, _ = select.select([], list(pending), [], min(wait, ATTEMPT_DELAY) if remaining else wait)
+                for sock in writable:
+                    address_info, _ = pending.pop(sock)
+                    code = sock.getsockopt(usocket.SOL_SOCKET, usocket.SO_ERROR)
+                    if not code:
+                        sock.setblocking(True)
+                        sock.settimeout(timeout)
+                        return sock, address_info
+                    sock.close()
+                    error = OSError(code, os.strerror(code))
+                now = monotonic()
+                for sock, (address_info, deadline) in list(pending.items()):
+                    if deadline <= now:
+                        del pending[sock]
+                        sock.close()
+                        error = usocket.timeout('timed out')
+            raise error
+        finally:
+            for sock in pending:
+                sock.close()
+
+
+    class _Inflater:
+        '''
+        Decompresses a gzip or deflate body read through read_raw, one input block at a time. Output is limited to the
+        space left in the caller's buffer, so memory use is bounded by the zlib window and one block.
+        '''
+
+        def __init__(self, read_raw, content_encoding: str):
+            self._read_raw = read_raw
+            self._gzip = content_encoding == 'gzip'
+            self._block = buffer_pool.take(BLOCK_SIZE)
+            self._block_view = memoryview(self._block)
+            self._pending = b''
+            self._decompressor = None
+
+        def _start(self, data):
+            import zlib
+            if self._gzip:
+                wbits = 31
+            else:
+                # "deflate" should be zlib wrapped, but some servers send a raw deflate stream.
+                wbits = 15 if len(data) > 1 and (data[0] & 0x0F) == 8 and (data[0] << 8 | data[1]) % 31 == 0 else -15
+            self._decompressor = zlib.decompressobj(wbits)
+
+        def readinto(self, buff) -> int:
+            view = memoryview(buff)
+            read = 0
+            while read < len(view):
+                if not self._pending:
+                    if self._block is None:
+                        break
+                    if self._decompressor is not None and self._decompressor.eof:
+                        # Consume the end of the framing (e.g. the last chunk) so the connection can be reused.
+                        while self._read_raw(self._block):
+                            pass
+                        self.close()
+                        break
+                    received = self._read_raw(self._block)
+                    if not received:
+                        self.close()  # The body ended, possibly before the stream did
+                        break
+                    self._pending = self._block_view[:received]
+                    if self._decompressor is None:
+                        self._start(self._pending)
+                data = self._decompressor.decompress(self._pending, len(view) - read)
+                self._pending = self._decompressor.unconsumed_tail
+                view[read:read + len(data)] = data
+                read += len(data)
+            return read
+
+        def close(self):
+            '''
+            Gives the block back to the pool, also when the body was not read to its end.
+            '''
+            if self._block is not None:
+                buffer_pool.give(self._block)
+                self._block = self._block_view = None
+                self._pending = b''
+
+
+    class _Deflater:
+        '''
+        Compresses a body into gzip or zlib wrapped deflate with zlib.compressobj.
+        '''
+
+        def __init__(self, content_encoding: str):
+            import zlib
+            self._compressor = zlib.compressobj(wbits=31 if content_encoding == 'gzip' else 15)
+
+        def compress(self, data) -> bytes:
+            return self._compressor.compress(data)
+
+        def flush(self) -> bytes:
+            return self._compressor.flush()
 
 
     class SocketInterface:
-        def __init__(self, sock):
+        '''
+        Buffered reader over a CPython socket.
+
+        Data is received with a single ``recv_into`` into a reusable buffer, ``readline``, ``read`` and ``readinto``
+        are then served from that buffer instead of issuing one ``recv`` per byte.
+        '''
+
+        def __init__(self, sock, buffer_size: int = None, on_close=None):
             self._sock = sock
+            self._on_close = on_close
+            self.tls_resumed = bool(getattr(sock, 'session_reused', False))
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self._buff = buffer_pool.take(buffer_size or READ_BUFFER_SIZE)
+            self._view = memoryview(self._buff)
+            self._start = 0
+            self._end = 0
+            self._wbuff = buffer_pool.take(WRITE_BUFFER_SIZE)
+            self._wview = memoryview(self._wbuff)
+            self._wlen = 0
+            # TLS sockets do not implement sendmsg, their writes are flushed one after the other instead.
+            self._scatter = hasattr(sock, 'sendmsg') and not isinstance(sock, ssl.SSLSocket)
 
         def settimeout(self, value):
             return self._sock.settimeout(value)
 
         def write(self, data: bytes):
-            # print(data)
-            self._sock.send(data)
+            # Small writes are coalesced so the request head and small bodies leave in a single segment.
+            size = len(data)
+            self.bytes_sent += size
+            if self._wlen + size <= len(self._wbuff):
+                self._wview[self._wlen:self._wlen + size] = data
+                self._wlen += size
+            elif not self._wlen:
+                self._sock.sendall(data)
+            elif self._scatter:
+                self._sendmsg(self._wview[:self._wlen], memoryview(data))
+                self._wlen = 0
+            else:
+                self.flush()
+                self._sock.sendall(data)
+
+        def _sendmsg(self, head, data):
+            sent = self._sock.sendmsg([head, data])
+            if sent < len(head):
+                self._sock.sendall(head[sent:])
+                sent = len(head)
+            if sent - len(head) < len(data):
+                self._sock.sendall(data[sent - len(head):])
+
+        def flush(self):
+            if self._wlen:
+                self._sock.sendall(self._wview[:self._wlen])
+                self._wlen = 0
+
+        def _fill(self) -> int:
+            if self._start == self._end:
+                self._start = self._end = 0
+            elif self._end == len(self._buff):
+                # Move the unread tail to the front so there is room to receive into.
+                remaining = self._end - self._start
+                self._view[:remaining] = self._view[self._start:self._end]
+                self._start, self._end = 0, remaining
+            received = self._sock.recv_into(self._view[self._end:])
+            self._end += received
+            return received
 
         def read(self, size=None):
-            size = 1024 if size is None else size
-            buff = b''
-            while len(buff) < size:
-                buff += self._sock.recv(1)
-            return buff
+            if size is None:
+                buff = bytearray(self._view[self._start:self._end])
+                self._start = self._end = 0
+                while True:
+                    received = self._sock.recv_into(self._view)
+                    if not received:
+                        self.bytes_received += len(buff)
+                        return bytes(buff)
+                    buff += self._view[:received]
+            if self._end - self._start >= size:
+                data = bytes(self._view[self._start:self._start + size])
+                self._start += size
+                self.bytes_received += size
+                return data
+            buff = bytearray(size)
+            read = self.readinto(buff)
+            return bytes(buff) if read == size else bytes(buff[:read])
+
+        def readinto(self, buff) -> int:
+            view = memoryview(buff)
+            size = len(view)
+            read = min(size, self._end - self._start)
+            view[:read] = self._view[self._start:self._start + read]
+            self._start += read
+            while read < size:
+                if size - read >= len(self._buff):
+                    # Large reads bypass the internal buffer and land directly in the caller's memory.
+                    received = self._sock.recv_into(view[read:])
+                    if not received:
+                        break
+                    read += received
+                    continue
+                if not self._fill():
+                    break
+                count = min(size - read, self._end - self._start)
+                view[read:read + count] = self._view[self._start:self._start + count]
+                self._start += count
+                read += count
+            self.bytes_received += read
+            return read
+
+        def sendfile(self, file, count: int) -> int:
+            # socket.sendfile uses os.sendfile on plain TCP sockets and falls back to send() under TLS.
+            self.flush()
+            sent = self._sock.sendfile(file, count=count)
+            self.bytes_sent += sent
+            return sent
 
         def readline(self):
-            buff = b''
+            line = None
             while True:
-                buff += self._sock.recv(1)
-                if buff.endswith(b'\r\n'):
-                    break
-            return buff
+                index = self._buff.find(b'\n', self._start, self._end)
+                if index >= 0:
+                    data = bytes(self._view[self._start:index + 1])
+                    self._start = index + 1
+                    data = data if line is None else bytes(line + data)
+                    self.bytes_received += len(data)
+                    return data
+                if self._start < self._end:
+                    # Line is longer than the buffer, keep what we have and carry on reading.
+                    line = bytearray() if line is None else line
+                    line += self._view[self._start:self._end]
+                    self._start = self._end = 0
+                if not self._fill():
+                    data = b'' if line is None else bytes(line)
+                    self.bytes_received += len(data)
+                    return data
 
         def close(self):
+            if self._on_close is not None:
+                self._on_close(self._sock)
             self._sock.close()
+            if self._buff is not None:
+                buffer_pool.give(self._buff)
+                buffer_pool.give(self._wbuff)
+                self._buff = self._view = self._wbuff = self._wview = None
+                self._start = self._end = self._wlen = 0
 
-types_map = {
-    '.js': 'application/javascript',
-    '.mjs': 'application/javascript',
-    '.json': 'application/json',
-    '.webmanifest': 'application/manifest+json',
-    '.doc': 'application/msword',
-    '.dot': 'application/msword',
-    '.wiz': 'application/msword',
-    '.bin': 'application/octet-stream',
-    '.a': 'application/octet-stream',
-    '.dll': 'application/octet-stream',
-    '.exe': 'application/octet-stream',
-    '.o': 'application/octet-stream',
-    '.obj': 'application/octet-stream',
-    '.so': 'application/octet-stream',
-    '.oda': 'application/oda',
-    '.pdf': 'application/pdf',
-    '.p7c': 'application/pkcs7-mime',
-    '.ps': 'application/postscript',
-    '.ai': 'application/postscript',
-    '.eps': 'application/postscript',
-    '.m3u': 'application/vnd.apple.mpegurl',
-    '.m3u8': 'application/vnd.apple.mpegurl',
-    '.xls': 'application/vnd.ms-excel',
-    '.xlb': 'application/vnd.ms-excel',
-    '.ppt': 'application/vnd.ms-powerpoint',
-    '.pot': 'application/vnd.ms-powerpoint',
-    '.ppa': 'application/vnd.ms-powerpoint',
-    '.pps': 'application/vnd.ms-powerpoint',
-    '.pwz': 'application/vnd.ms-powerpoint',
-    '.wasm': 'application/wasm',
-    '.bcpio': 'application/x-bcpio',
-    '.cpio': 'application/x-cpio',
-    '.csh': 'application/x-csh',
-    '.dvi': 'application/x-dvi',
-    '.gtar': 'application/x-gtar',
-    '.hdf': 'application/x-hdf',
-    '.h5': 'application/x-hdf5',
-    '.latex': 'application/x-latex',
-    '.mif': 'application/x-mif',
-    '.cdf': 'application/x-netcdf',
-    '.nc': 'application/x-netcdf',
-    '.p12': 'application/x-pkcs12',
-    '.pfx': 'application/x-pkcs12',
-    '.ram': 'application/x-pn-realaudio',
-    '.pyc': 'application/x-python-code',
-    '.pyo': 'application/x-python-code',
-    '.sh': 'application/x-sh',
-    '.shar': 'application/x-shar',
-    '.swf': 'application/x-shockwave-flash',
-    '.sv4cpio': 'application/x-sv4cpio',
-    '.sv4crc': 'application/x-sv4crc',
-    '.tar': 'application/x-tar',
-    '.tcl': 'application/x-tcl',
-    '.tex': 'application/x-tex',
-    '.texi': 'application/x-texinfo',
-    '.texinfo': 'application/x-texinfo',
-    '.roff': 'application/x-troff',
-    '.t': 'application/x-troff',
-    '.tr': 'application/x-troff',
-    '.man': 'application/x-troff-man',
-    '.me': 'application/x-troff-me',
-    '.ms': 'application/x-troff-ms',
-    '.ustar': 'application/x-ustar',
-    '.src': 'application/x-wais-source',
-    '.xsl': 'application/xml',
-    '.rdf': 'application/xml',
-    '.wsdl': 'application/xml',
-    '.xpdl': 'application/xml',
-    '.zip': 'application/zip',
-    '.3gp': 'audio/3gpp',
-    '.3gpp': 'audio/3gpp',
-    '.3g2': 'audio/3gpp2',
-    '.3gpp2': 'audio/3gpp2',
-    '.aac': 'audio/aac',
-    '.adts': 'audio/aac',
-    '.loas': 'audio/aac',
-    '.ass': 'audio/aac',
-    '.au': 'audio/basic',
-    '.snd': 'audio/basic',
-    '.mp3': 'audio/mpeg',
-    '.mp2': 'audio/mpeg',
-    '.opus': 'audio/opus',
-    '.aif': 'audio/x-aiff',
-    '.aifc': 'audio/x-aiff',
-    '.aiff': 'audio/x-aiff',
-    '.ra': 'audio/x-pn-realaudio',
-    '.wav': 'audio/x-wav',
-    '.bmp': 'image/bmp',
-    '.gif': 'image/gif',
-    '.ief': 'image/ief',
-    '.jpg': 'image/jpeg',
-    '.jpe': 'image/jpeg',
-    '.jpeg': 'image/jpeg',
-    '.heic': 'image/heic',
-    '.heif': 'image/heif',
-    '.png': 'image/png',
-    '.svg': 'image/svg+xml',
-    '.tiff': 'image/tiff',
-    '.tif': 'image/tiff',
-    '.ico': 'image/vnd.microsoft.icon',
-    '.ras': 'image/x-cmu-raster',
-    '.pnm': 'image/x-portable-anymap',
-    '.pbm': 'image/x-portable-bitmap',
-    '.pgm': 'image/x-portable-graymap',
-    '.ppm': 'image/x-portable-pixmap',
-    '.rgb': 'image/x-rgb',
-    '.xbm': 'image/x-xbitmap',
-    '.xpm': 'image/x-xpixmap',
-    '.xwd': 'image/x-xwindowdump',
-    '.eml': 'message/rfc822',
-    '.mht': 'message/rfc822',
-    '.mhtml': 'message/rfc822',
-    '.nws': 'message/rfc822',
-    '.css': 'text/css',
-    '.csv': 'text/csv',
-    '.html': 'text/html',
-    '.htm': 'text/html',
-    '.txt': 'text/plain',
-    '.bat': 'text/plain',
-    '.c': 'text/plain',
-    '.h': 'text/plain',
-    '.ksh': 'text/plain',
-    '.pl': 'text/plain',
-    '.rtx': 'text/richtext',
-    '.tsv': 'text/tab-separated-values',
-    '.py': 'text/x-python',
-    '.etx': 'text/x-setext',
-    '.sgm': 'text/x-sgml',
-    '.sgml': 'text/x-sgml',
-    '.vcf': 'text/x-vcard',
-    '.xml': 'text/xml',
-    '.mp4': 'video/mp4',
-    '.mpeg': 'video/mpeg',
-    '.m1v': 'video/mpeg',
-    '.mpa': 'video/mpeg',
-    '.mpe': 'video/mpeg',
-    '.mpg': 'video/mpeg',
-    '.mov': 'video/quicktime',
-    '.qt': 'video/quicktime',
-    '.webm': 'video/webm',
-    '.avi': 'video/x-msvideo',
-    '.movie': 'video/x-sgi-movie',
-}
+
+def __getattr__(name):
+    # types_map is built from the compact table in uhttp.mime only if something still asks for the dict.
+    if name == 'types_map':
+        from .mime import build_types_map
+        globals()['types_map'] = build_types_map()
+        return globals()['types_map']
+    raise AttributeError(name)
 
 
 def random_string(length: int):
@@ -219,74 +584,471 @@ def random_string(length: int):
     return ''.join(random.choice(numbers + letters_upper + letters_lower) for _ in range(length))
 
 
+def _to_bytes(text) -> bytes:
+    return text if isinstance(text, (bytes, bytearray)) else str(text).encode(ENCODING)
+
+
+class Headers:
+    '''
+    Case-insensitive header store that keeps repeated fields.
+
+    Names and values are kept as the bytes read off the socket in two parallel lists and only decoded when they are
+    looked up. get() and [] join repeated fields with ', ', get_all() returns them one by one.
+    '''
+    __slots__ = ('_names', '_values')
+
+    def __init__(self, headers=None):
+        self._names = []
+        self._values = []
+        if headers:
+            for name, value in headers.items():
+                self.add(name, value)
+
+    def add(self, name, value):
+        self._names.append(_to_bytes(name))
+        self._values.append(_to_bytes(value))
+
+    def read_from(self, sock):
+        '''
+        Reads header lines up to and including the blank line that ends the block.
+        '''
+        names, values = self._names, self._values
+        while True:
+            line = sock.readline()
+            if not line or line == b'\r\n':
+                break
+            colon = line.find(b':')
+            if colon < 1:
+                raise ValueError(f'Invalid header line: {line}')
+            names.append(line[:colon].strip())
+            values.append(line[colon + 1:].strip())
+        return self
+
+    def raw(self, name: bytes):
+        '''
+        Returns the last value of the field as undecoded bytes, or None. name must be lower case bytes.
+        '''
+        names = self._names
+        size = len(name)
+        for index in range(len(names) - 1, -1, -1):
+            candidate = names[index]
+            if len(candidate) == size and candidate.lower() == name:
+                return self._values[index]
+        return None
+
+    def get_all(self, name: str) -> list:
+        name = _to_bytes(name).lower()
+        return [value.decode(ENCODING) for key, value in zip(self._names, self._values) if key.lower() == name]
+
+    def get(self, name: str, default=None):
+        values = self.get_all(name)
+        return ', '.join(values) if values else default
+
+    def __getitem__(self, name: str) -> str:
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name: str) -> bool:
+        return self.raw(_to_bytes(name).lower()) is not None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self) -> list:
+        return [name.decode(ENCODING) for name in self._names]
+
+    def values(self) -> list:
+        return [value.decode(ENCODING) for value in self._values]
+
+    def items(self) -> list:
+        return list(zip(self.keys(), self.values()))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (Headers, dict)):
+            return NotImplemented
+        return {name.lower(): self.get(name) for name in self} == {name.lower(): other.get(name) for name in other}
+
+    def __repr__(self):
+        return f'Headers({self.items()})'
+
+
+# Bytes ending the size on a chunk size line: ';', ' ', '\t', '\r' and '\n'. Ints, since MicroPython only looks for
+# buffers in bytes.
+_CHUNK_SIZE_END = (59, 32, 9, 13, 10)
+
+
+class ChunkedDecoder:
+    '''
+    Decodes a chunked transfer-encoded body straight from the socket.
+
+    Chunk-size lines are parsed byte by byte, chunk extensions are ignored and trailer fields are collected into
+    the ``trailers`` Headers. Set ``debug`` (on the class or an instance) to a callable such as ``print`` to log
+    each chunk.
+    '''
+    debug = None
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._left = 0
+        self.done = False
+        self.trailers = Headers()
+
+    def _next_chunk_size(self) -> int:
+        line = self._sock.readline()
+        size = 0
+        digits = 0
+        for byte in line:
+            lower = byte | 0x20
+            if 48 <= byte <= 57:
+                size = (size << 4) | (byte - 48)
+            elif 97 <= lower <= 102:
+                size = (size << 4) | (lower - 87)
+            elif byte in _CHUNK_SIZE_END:
+                break
+            else:
+                raise ValueError(f'Invalid chunk size line: {line}')
+            digits += 1
+        if not digits:
+            raise ValueError(f'Invalid chunk size line: {line}')
+        if self.debug is not None:
+            self.debug(f'Chunk Length: {size}')
+        return size
+
+    def _read_trailers(self):
+        self.trailers.read_from(self._sock)
+
+    def readinto(self, buff) -> int:
+        view = memoryview(buff)
+        read = 0
+        while read < len(view) and not self.done:
+            if not self._left:
+                self._left = self._next_chunk_size()
+                if not self._left:
+                    self._read_trailers()
+                    self.done = True
+                    break
+            count = self._sock.readinto(view[read:read + min(self._left, len(view) - read)])
+            if not count:
+                raise OSError('Connection closed in the middle of a chunk.')
+            self._left -= count
+            read += count
+            if not self._left and self._sock.readline() != b'\r\n':
+                raise ValueError('End of Chunk not detected.')
+        return read
+
+    def decode_to(self, write, block_size: int = None):
+        '''
+        Streams the decoded body to write, e.g. outfile.write or bytearray.extend, through one pooled block.
+        '''
+        _pump(self.readinto, write, block_size)
+
+    def decode(self) -> bytearray:
+        body = bytearray()
+        self.decode_to(body.extend)
+        return body
+
+
+# Callbacks called as hook(event, timings) for every request, e.g. to export metrics. Events are 'dns', 'connect',
+# 'tls', 'sent', 'headers' and 'done'. Nothing is called while the list is empty.
+hooks = []
+
+
+def _emit(callbacks, event: str, timings):
+    for callback in callbacks:
+        callback(event, timings)
+
+
+class Timings:
+    '''
+    ticks_us() timestamps of each phase of one request, with the bytes sent and received, the status and whether a
+    pooled connection was reused.
+
+    dns, connect and tls stay None when a pooled connection is reused. durations() gives each phase in milliseconds.
+    '''
+    __slots__ = ('start', 'dns', 'connect', 'tls', 'sent', 'first_byte', 'headers', 'done', 'bytes_sent',
+                 'bytes_received', 'status', 'reused')
+
+    def __init__(self):
+        self.start = ticks_us()
+        self.dns = self.connect = self.tls = self.sent = self.first_byte = self.headers = self.done = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.status = None
+        self.reused = False
+
+    @staticmethod
+    def _span(start, end):
+        return None if start is None or end is None else ticks_diff(end, start) / 1000
+
+    def durations(self) -> dict:
+        ready = self.tls or self.connect or self.start
+        return {
+            'dns': self._span(self.start, self.dns),
+            'connect': self._span(self.dns, self.connect),
+            'tls': self._span(self.connect, self.tls),
+            'send': self._span(ready, self.sent),
+            'ttfb': self._span(self.sent, self.first_byte),
+            'headers': self._span(self.first_byte, self.headers),
+            'body': self._span(self.headers, self.done),
+            'total': self._span(self.start, self.done),
+        }
+
+    def __repr__(self):
+        return f'Timings({self.durations()}, sent={self.bytes_sent}, received={self.bytes_received})'
+
+
+class _NoResponse(OSError):
+    '''The connection closed before the first byte of a response.'''
+
+
 class HttpResponse:
-    def __init__(self, sock, save_to_file: str = None):
+    def __init__(self, sock, save_to_file: str = None, release=None, stream: bool = False, into=None,
+                 decompress: bool = False, timings: Timings = None, hooks: list = None, head: bool = False):
         self._save_to_file = save_to_file
+        self._into = into
         self._json = None
         self._sock = sock
+        self._release = release
+        self._released = False
+        self.tls_resumed = getattr(sock, 'tls_resumed', False)
+        self._stream = stream
         self.encoding = ENCODING
-        self.http_ver, self.status_code, self.status_text = sock.readline().decode(self.encoding).split(' ', 2)
+        self.from_cache = False
+        self.timings = Timings() if timings is None else timings
+        self._hooks = hooks
+        self._received_from = getattr(sock, 'bytes_received', None)
+        status_line = sock.readline()
+        if not status_line:
+            raise _NoResponse('Connection closed before a response was received.')
+        self.timings.first_byte = ticks_us()
+        self._status_line = status_line
+        self.status = self.timings.status = int(status_line[9:12])
         self.headers = self.build_headers_dict()
-        if self.headers.get('Transfer-Encoding') == 'chunked':
-            if self._save_to_file is not None:
-                self.save_chunks_to_file(self._save_to_file)
-            else:
-                self._content = self._read_chunks_into_memory()
-        elif self.headers.get('Content-Length') is not None:
-            if self._save_to_file is not None:
-                self.save_content_to_file(self._save_to_file)
-            else:
-                self._content = self._sock.read(int(self.headers.get('Content-Length')))
-        self._sock.close()
-
-    def _read_chunk(self):
-        chunk_len_hex = self._sock.readline().decode(self.encoding).strip()  # First Line is chunk size in HEX
-        chunk_len_dec = int(chunk_len_hex, 16)
-        print(f'Chunk Length: {chunk_len_dec}')
-        if chunk_len_dec == 0:
-            return None
-        chunk = self._sock.read(size=chunk_len_dec)
-        if not self._sock.readline() == b'\r\n':
-            raise ValueError('End of Chunk not detected.')
-        return chunk
-
-    def _read_chunks_into_memory(self):
-        chunks = b''
-        while True:
-            chunk = self._read_chunk()
-            if chunk is None:
-                break
-            chunks += chunk
-            print(f'Chunk: {chunk} | Len {len(chunk)}')
-        return chunks
+        self.timings.headers = ticks_us()
+        if hooks:
+            _emit(hooks, 'headers', self.timings)
+        headers = self.headers
+        # A reply to HEAD carries the Content-Length of the body it leaves out.
+        no_body = head or self.status in (204, 304) or self.status < 200
+        content_length = headers.raw(b'content-length')
+        transfer_encoding = headers.raw(b'transfer-encoding')
+        chunked = not no_body and transfer_encoding is not None and transfer_encoding.lower().endswith(b'chunked')
+        self._decoder = ChunkedDecoder(sock) if chunked else None
+        self._framed = no_body or chunked or content_length is not None
+        self._remaining = 0 if no_body else None if chunked or content_length is None else int(content_length)
+        self._body_done = self._remaining == 0
+        content_encoding = headers.raw(b'content-encoding') if decompress else None
+        content_encoding = content_encoding.lower().decode(ENCODING) if content_encoding is not None else ''
+        if content_encoding in ('gzip', 'deflate'):
+            self._inflater = _Inflater(self._read_raw_into, content_encoding)
+        else:
+            self._inflater = None
+        if self._stream:
+            # Body is left on the socket for iter_content / iter_lines / readinto.
+            if self._body_done:
+                self.close()
+            return
+        if self._save_to_file is not None:
+            self._copy_body_to_file(self._save_to_file)
+        elif self._into is not None:
+            self._content = self._read_into_buffer(self._into)
+        elif self._decoder is not None and self._inflater is None:
+            self._content = self._decoder.decode()
+        elif self._remaining is not None and self._inflater is None:
+            self._content = self._sock.read(self._remaining)
+            if len(self._content) < self._remaining:
+                self.close()
+                raise OSError('Connection closed before the full body was received.')
+        else:
+            # Compressed, or without framing and read until the server closes the connection.
+            self._content = self._read_all()
+        self._body_done = True
+        self.close()
 
-    def save_chunks_to_file(self, file_name: str):
+    @property
+    def http_ver(self) -> str:
+        return self._status_line[:8].decode(self.encoding)
+
+    @property
+    def status_code(self) -> str:
+        '''
+        The status as a str, kept for compatibility. Use ``status`` for the int.
+        '''
+        return str(self.status)
+
+    @property
+    def status_text(self) -> str:
+        return self._status_line[13:].strip().decode(self.encoding)
+
+    def _keep_alive(self) -> bool:
+        connection = self.headers.raw(b'connection')
+        connection = b'' if connection is None else connection.lower()
+        if self._status_line.startswith(b'HTTP/1.0'):
+            return connection == b'keep-alive'
+        return connection != b'close'
+
+    def _release_connection(self, reusable: bool):
+        self._released = True
+        timings = self.timings
+        timings.done = ticks_us()
+        if self._received_from is not None:
+            timings.bytes_received = self._sock.bytes_received - self._received_from
+        if self._hooks:
+            _emit(self._hooks, 'done', timings)
+        if reusable and self._release is not None:
+            self._release(self._sock)
+        else:
+            self._sock.close()
+
+    def close(self):
+        '''
+        Releases the connection. A body that has not been read to the end leaves the connection unusable,
+        so it is closed rather than returned to a Session.
+        '''
+        if self._inflater is not None:
+            self._inflater.close()
+        self._close_connection()
+
+    def _close_connection(self):
+        if not self._released:
+            self._release_connection(self._framed and self._body_done and self._keep_alive())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _copy_body_to_file(self, file_name: str):
+        # One pooled block keeps memory use constant regardless of the body size.
         with open(file_name, 'wb') as outfile:
+            _pump(self.readinto, outfile.write)
+
+    def save_chunks_to_file(self, file_name: str):
+        self._copy_body_to_file(file_name)
+
+    def save_content_to_file(self, file_name: str):
+        self._copy_body_to_file(file_name)
+
+    def _read_all(self) -> bytearray:
+        body = bytearray()
+        _pump(self.readinto, body.extend)
+        return body
+
+    def _read_into_buffer(self, buff):
+        view = memoryview(buff)
+        if self._inflater is None and self._remaining is not None and self._remaining > len(view):
+            self.close()
+            raise ValueError(f'Response body of {self._remaining} bytes does not fit the {len(view)} byte buffer.')
+        read = 0
+        while read < len(view):
+            count = self.readinto(view[read:])
+            if not count:
+                break
+            read += count
+        if read == len(view) and self.readinto(bytearray(1)):
+            self.close()
+            raise ValueError(f'Response body does not fit the {len(view)} byte buffer.')
+        return view[:read]
+
+    def _finish_body(self):
+        self._body_done = True
+        # The inflater may still hold decompressed data, it gives its block back once that is read.
+        self._close_connection()
+
+    def readinto(self, buff) -> int:
+        '''
+        Reads the next part of a streamed body into buff. Returns the number of bytes read, 0 once the body is
+        exhausted.
+        '''
+        if self._inflater is not None:
+            return self._inflater.readinto(buff)
+        return self._read_raw_into(buff)
+
+    def _read_raw_into(self, buff) -> int:
+        if self._body_done:
+            return 0
+        view = memoryview(buff)
+        if self._decoder is not None:
+            read = self._decoder.readinto(view)
+            if self._decoder.done:
+                self._finish_body()
+            return read
+        if self._remaining is None:
+            read = self._sock.readinto(view)
+            if read < len(view):
+                self._finish_body()
+            return read
+        view = view[:self._remaining]
+        read = self._sock.readinto(view)
+        self._remaining -= read
+        if read < len(view):
+            self.close()
+            raise OSError('Connection closed before the full body was received.')
+        if self._remaining == 0:
+            self._finish_body()
+        return read
+
+    def iter_content(self, chunk_size: int = 512):
+        if not self._stream:
+            content = self.content
+            for index in range(0, len(content), chunk_size):
+                yield content[index:index + chunk_size]
+            return
+        buff = buffer_pool.take(chunk_size)
+        try:
             while True:
-                chunk = self._read_chunk()
-                if chunk is None:
+                read = self.readinto(buff)
+                if not read:
                     break
-                outfile.write(chunk)
+                yield bytes(buff[:read])
+        finally:
+            buffer_pool.give(buff)
+
+    def iter_lines(self, chunk_size: int = 512):
+        pending = b''
+        for data in self.iter_content(chunk_size):
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line[:-1] if line.endswith(b'\r') else line
+        if pending:
+            yield pending
+
+    def iter_json(self, prefix: str = None, chunk_size: int = 512):
+        '''
+        Decodes the body incrementally. Without a prefix it yields (prefix, event, value) tuples, with one it yields
+        each value found at that dotted path, e.g. 'state.reported' or 'readings.item'. Use stream=True so only
+        chunk_size bytes of the body are held at a time.
+        '''
+        from . import json_stream
+        if prefix is None:
+            return iter(json_stream.JsonEvents(self.iter_content(chunk_size)))
+        return json_stream.items(self.iter_content(chunk_size), prefix)
+
+    def build_headers_dict(self) -> Headers:
+        return Headers().read_from(self._sock)
 
-    def save_content_to_file(self, file_name: str):
-        with open(file_name, 'wb') as outfile:
-            data = self._sock.read(int(self.headers.get('Content-Length')))
-            outfile.write(data)
+    @property
+    def trailers(self) -> Headers:
+        return Headers() if self._decoder is None else self._decoder.trailers
 
-    def build_headers_dict(self) -> dict:
-        headers = {}
-        while True:
-            line = self._sock.readline()
-            if not line or line == b'\r\n':
-                break
-            header, header_val = line.decode(self.encoding).strip().split(': ', 1)
-            headers[header] = header_val
-        return headers
+    @property
+    def content(self):
+        if self._stream:
+            self._content = b''.join(self.iter_content(READ_BUFFER_SIZE))
+            self._stream = False
+        return self._content
 
     @property
     def text(self):
         try:
-            return self._content.decode(self.encoding)
+            return str(self.content, self.encoding)
         except UnicodeError as e:
             return self._content
         except AttributeError as e:
@@ -296,14 +1058,98 @@ class HttpResponse:
     def json(self):
         if self._json is None:
             import json
-            self._json = json.loads(self._content)
+            content = self.content
+            self._json = json.loads(content if self._into is None else str(content, self.encoding))
         return self._json
 
 
+def _pump(readinto, write, size: int = None):
+    '''
+    Copies from readinto to write until readinto returns 0, through one buffer borrowed from the pool.
+    '''
+    buff = buffer_pool.take(size or READ_BUFFER_SIZE)
+    view = memoryview(buff)
+    try:
+        while True:
+            read = readinto(buff)
+            if not read:
+                return
+            write(view[:read])
+    finally:
+        buffer_pool.give(buff)
+
+
+def _send_file(sock, file_name: str, length: int, block_size: int = None):
+    with open(file_name, 'rb') as reader:
+        if hasattr(sock, 'sendfile'):
+            if sock.sendfile(reader, length) != length:
+                raise ValueError(f'{file_name} is shorter than the length announced for it.')
+            return
+        block_size = block_size or BLOCK_SIZE
+        buff = buffer_pool.take(block_size)
+        view = memoryview(buff)
+        try:
+            while length:
+                read = reader.readinto(view[:min(length, block_size)])
+                if not read:
+                    raise ValueError(f'{file_name} is shorter than the length announced for it.')
+                sock.write(view[:read])
+                length -= read
+        finally:
+            buffer_pool.give(buff)
+
+
+class _ChunkedWriter:
+    '''
+    Frames every write as one chunk of a chunked transfer-encoded body, compressing it first when asked to.
+    '''
+
+    def __init__(self, sock, compress: str = None):
+        self._sock = sock
+        self._deflater = None if compress is None else _Deflater(compress)
+
+    def _write_chunk(self, data):
+        if len(data):
+            self._sock.write(b"%x\r\n" % len(data))
+            self._sock.write(data)
+            self._sock.write(b"\r\n")
+
+    def write(self, data):
+        self._write_chunk(data if self._deflater is None else self._deflater.compress(data))
+
+    def close(self):
+        if self._deflater is not None:
+            self._write_chunk(self._deflater.flush())
+        self._sock.write(b"0\r\n\r\n")
+
+
+def _check_compress(compress):
+    if compress not in (None, 'gzip', 'deflate'):
+        raise ValueError(f'Unsupported compression: {compress}, use gzip or deflate.')
+    return compress
+
+
+def _compress_bytes(data: bytes, compress: str) -> bytes:
+    deflater = _Deflater(compress)
+    return deflater.compress(data) + deflater.flush()
+
+
+def _send_file_chunked(sock, file_name: str, chunk_size: int, compress: str = None):
+    writer = _ChunkedWriter(sock, compress)
+    with open(file_name, 'rb') as reader:
+        _pump(reader.readinto, writer.write, chunk_size)
+    writer.close()
+
+
 class HttpBody:
     def send_body(self, sock):
         raise NotImplementedError
 
+    @staticmethod
+    def _send_content_encoding(sock, compress: str):
+        if compress is not None:
+            sock.write(b'Content-Encoding: %s\r\n' % compress.encode(ENCODING))
+
 
 class HttpBodyEmpty(HttpBody):
     def send_body(self, sock):
@@ -311,48 +1157,97 @@ class HttpBodyEmpty(HttpBody):
 
 
 class HttpBodyJSON(HttpBody):
-    def __init__(self, json_data: dict):
+    def __init__(self, json_data: dict, compress: str = None):
         import json
         self._json_data: dict = json_data
+        self._compress = _check_compress(compress)
         self._json_bytes_str: bytes = json.dumps(self._json_data).encode(ENCODING)
+        if self._compress is not None:
+            self._json_bytes_str = _compress_bytes(self._json_bytes_str, self._compress)
         self.content_len = len(self._json_bytes_str)
 
     def send_body(self, sock):
         sock.write(b'Content-Type: application/json\r\n')
+        self._send_content_encoding(sock, self._compress)
         sock.write(b"Content-Length: %d\r\n" % self.content_len)
         sock.write(b"\r\n")
         sock.write(self._json_bytes_str)
 
 
+class HttpBodyJSONStream(HttpBody):
+    '''
+    Serializes json_data straight to the socket with chunked transfer encoding, so the encoded document is never held
+    in memory. Pieces are gathered into chunks of about chunk_size bytes.
+    '''
+
+    def __init__(self, json_data, chunk_size: int = 512, compress: str = None):
+        self._json_data = json_data
+        self._chunk_size = chunk_size
+        self._compress = _check_compress(compress)
+
+    def send_body(self, sock):
+        from .json_stream import iterencode
+        sock.write(b'Content-Type: application/json\r\n')
+        self._send_content_encoding(sock, self._compress)
+        sock.write(b"Transfer-Encoding: chunked\r\n")
+        sock.write(b"\r\n")
+        writer = _ChunkedWriter(sock, self._compress)
+        pending = bytearray()
+        for piece in iterencode(self._json_data):
+            pending += piece.encode(ENCODING)
+            if len(pending) >= self._chunk_size:
+                writer.write(pending)
+                pending = bytearray()
+        writer.write(pending)
+        writer.close()
+
+
 class HttpBodyForm(HttpBody):
-    def __init__(self, form_data: dict):
+    def __init__(self, form_data: dict, compress: str = None):
         self._form_data = form_data
+        self._compress = _check_compress(compress)
         self._form_url_encoded = '&'.join(['='.join([str(k), str(v)]) for k, v in self._form_data.items()]).encode(
             ENCODING)
+        if self._compress is not None:
+            self._form_url_encoded = _compress_bytes(self._form_url_encoded, self._compress)
         self.content_len = len(self._form_url_encoded)
 
     def send_body(self, sock):
         sock.write(b'Content-Type: application/x-www-form-urlencoded\r\n')
+        self._send_content_encoding(sock, self._compress)
         sock.write(b"Content-Length: %d\r\n" % self.content_len)
         sock.write(b"\r\n")
         sock.write(self._form_url_encoded)
 
 
 class HttpBodyFile(HttpBody):
-    def __init__(self, file_name: str):
+    '''
+    Sends a file with a Content-Length taken from os.stat. A compressed file has no length known up front, it is
+    compressed block by block and sent with chunked transfer encoding instead.
+    '''
+
+    def __init__(self, file_name: str, compress: str = None):
         self._file_name = file_name
         self._name, self._ext = self._file_name.split('.')
         self._name = self._name.encode(ENCODING)
         self._ext = ('.' + self._ext).encode(ENCODING)
-        with open(self._file_name, 'rb') as file:
-            self._file_data_bytes = file.read()
-        self.content_len = len(self._file_data_bytes)
+        self._compress = _check_compress(compress)
+        self.content_len = os.stat(self._file_name)[6] if self._compress is None else None
 
     def send_body(self, sock):
-        sock.write(b"Content-Length: %d\r\n" % self.content_len)
-        sock.write(b'Content-Type: %s\r\n' % types_map[self._ext.decode(ENCODING)].encode(ENCODING))
+        if self._compress is None:
+            sock.write(b"Content-Length: %d\r\n" % self.content_len)
+        from .mime import guess_type
+        content_type = guess_type(self._ext.decode(ENCODING), 'application/octet-stream')
+        sock.write(b'Content-Type: %s\r\n' % content_type.encode(ENCODING))
+        if self._compress is not None:
+            self._send_content_encoding(sock, self._compress)
+            sock.write(b"Transfer-Encoding: chunked\r\n")
+            sock.write(b"\r\n")
+            _send_file_chunked(sock, self._file_name, BLOCK_SIZE, self._compress)
+            return
         sock.write(b"\r\n")
-        sock.write(self._file_data_bytes)
+        _send_file(sock, self._file_name, self.content_len)
 
 
 class HttpBodyMultiFileSection:
@@ -369,29 +1264,38 @@ class HttpBodyMultiFileSection:
         else:
             raise ValueError(f'HttpBodyMultiFile must either be passed a value or filepath argument.')
         self._value = b'' if value is None else value.encode(ENCODING)
+        self._data_len = 0
 
-    def _read_file(self):
+    def _file_len(self):
         try:
-            with open(self._file_path, 'rb') as reader:
-                data_bytes = reader.read()
-            return data_bytes
+            return os.stat(self._file_path)[6]
         except OSError:
             print('OS Error while accessing file - Ensure file exists.')
-            return b''
+            return 0
 
     def build_section(self, boundary, is_first=False, last_section=False):
-        data_bytes = self._read_file() if self._file_ext is not None else self._value
+        '''
+        Returns the framing sent before and after the section data, and the size of the whole section.
+        File sizes come from os.stat so no file is read until the body is sent.
+        '''
+        self._data_len = self._file_len() if self._file_ext is not None else len(self._value)
 
         start = b'--%s\r\n' % boundary if is_first else b''
         end = b'--%s--\r\n' % boundary if last_section else b'--%s\r\n' % boundary
 
+        from .mime import guess_type
         name = b' name="%s";' % self._name.encode(ENCODING)
         file_name = b' filename="%s"' % self._file_name.encode(ENCODING) if self._file_ext is not None else b''
-        section = [start, b'Content-Disposition: form-data;', name, file_name, b'\r\n',
-                   b'Content-Type: %s\r\n\r\n' % types_map.get(self._file_ext, 'text/plain').encode(
-                       ENCODING),
-                   data_bytes, b'\r\n', end]
-        return section, sum(len(item) for item in section)
+        head = b''.join([start, b'Content-Disposition: form-data;', name, file_name, b'\r\n',
+                         b'Content-Type: %s\r\n\r\n' % guess_type(self._file_ext, 'text/plain').encode(ENCODING)])
+        tail = b'\r\n' + end
+        return (head, tail), len(head) + self._data_len + len(tail)
+
+    def send_data(self, sock):
+        if self._file_ext is None:
+            sock.write(self._value)
+        elif self._data_len:
+            _send_file(sock, self._file_path, self._data_len)
 
 
 class HttpBodyMultiFile(HttpBody):
@@ -399,59 +1303,294 @@ class HttpBodyMultiFile(HttpBody):
      HTTP Multipart accepts a list of body sections with will then be combined and sent.
 
      Notes:
-         This body type should be avoided as it loads several files into memory. Chunked data should be used instead.
+         Files are streamed from disk in blocks while the body is sent, so only one block is held in memory.
+         Pass chunked=True to send the body with chunked transfer encoding instead of a Content-Length.
     '''
 
-    def __init__(self, http_body_sections: list):
+    def __init__(self, http_body_sections: list, chunked: bool = False):
         self._http_body_sections = http_body_sections
         self._boundary = random_string(20).encode(ENCODING)
-        self.content, self.content_len = self.generate_content()
+        self._chunked = chunked
+        self._framing, self.content_len = self.generate_content()
 
     def generate_content(self) -> (list, int):
-        complete_content = []
+        framing = []
         total_size = 0
         for index, section in enumerate(self._http_body_sections):
             is_last = index == len(self._http_body_sections) - 1
             is_first = index == 0
-            content, size = section.build_section(self._boundary, is_first=is_first, last_section=is_last)
-            complete_content += content
+            head_tail, size = section.build_section(self._boundary, is_first=is_first, last_section=is_last)
+            framing.append(head_tail)
             total_size += size
-        return complete_content, total_size
+        return framing, total_size
 
     def send_body(self, sock):
         sock.write(b'Content-Type: multipart/form-data; boundary=%s\r\n' % self._boundary)
-        sock.write(b"Content-Length: %d\r\n" % self.content_len)
-        sock.write(b'\r\n')
-        for line in self.content:
-            sock.write(line)
+        if self._chunked:
+            sock.write(b"Transfer-Encoding: chunked\r\n")
+            sock.write(b'\r\n')
+            writer = _ChunkedWriter(sock)
+        else:
+            sock.write(b"Content-Length: %d\r\n" % self.content_len)
+            sock.write(b'\r\n')
+            writer = sock
+        for section, (head, tail) in zip(self._http_body_sections, self._framing):
+            writer.write(head)
+            section.send_data(writer)
+            writer.write(tail)
+        if self._chunked:
+            writer.close()
 
 
 class HttpBodyChunked(HttpBody):
-    def __init__(self, file_name: str, chunk_size: int = 512):
+    def __init__(self, file_name: str, chunk_size: int = 512, compress: str = None):
         self._file_name = file_name
         _, self._file_ext = file_name.split('.')
         self._file_ext = f'.{self._file_ext}'
         self._chunk_size = chunk_size
+        self._compress = _check_compress(compress)
 
     def send_body(self, sock):
+        from .mime import guess_type
         sock.write(b"Transfer-Encoding: chunked\r\n")
-        sock.write(b'Content-Type: %s\r\n' % types_map.get(self._file_ext, 'text/plain').encode(
-            ENCODING))
+        sock.write(b'Content-Type: %s\r\n' % guess_type(self._file_ext, 'text/plain').encode(ENCODING))
+        self._send_content_encoding(sock, self._compress)
         sock.write(b'\r\n')
-        with open(self._file_name, 'rb') as reader:
-            while True:
-                chunk = reader.read(self._chunk_size)
-                if len(chunk) == 0:
-                    break
-                sock.write(b"%x\r\n" % len(chunk))
-                sock.write(chunk)
-                sock.write(b"\r\n")
-        sock.write(b"0\r\n\r\n")
+        _send_file_chunked(sock, self._file_name, self._chunk_size, self._compress)
+
+
+class DnsCache:
+    '''
+    getaddrinfo results keyed by (host, port).
+
+    Answers are kept for ``ttl`` seconds and failed lookups for ``negative_ttl`` seconds. At most ``max_size``
+    entries are kept, the least recently used entry is evicted first.
+    '''
+
+    def __init__(self, ttl: int = 300, negative_ttl: int = 10, max_size: int = 8):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._order = []
+        self._families = {}
+        # getaddrinfo itself runs outside the lock, threads only wait for each other on the bookkeeping.
+        self._lock = allocate_lock()
+
+    def _store(self, key, result, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._order.remove(key)
+            elif len(self._order) >= self.max_size:
+                del self._entries[self._order.pop(0)]
+            self._entries[key] = (ticks_ms() + ttl * 1000, result)
+            self._order.append(key)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if ticks_diff(expires_at, ticks_ms()) <= 0:
+                del self._entries[key]
+                self._order.remove(key)
+                return None
+            self._order.remove(key)
+            self._order.append(key)
+            return result
+
+    @staticmethod
+    def _key(host, port: int) -> tuple:
+        return host.encode(ENCODING) if isinstance(host, str) else host, port
+
+    def resolve(self, host, port: int) -> list:
+        key = self._key(host, port)
+        result = self._lookup(key)
+        if result is None:
+            try:
+                # The MicroPython resolver does not know localhost.
+                result = usocket.getaddrinfo(b'127.0.0.1' if key[0] == b'localhost' else key[0], port, 0,
+                                             usocket.SOCK_STREAM)
+                if len(result) < 1:
+                    raise ValueError('You are not connected to the internet...')
+            except (OSError, ValueError) as e:
+                self._store(key, e, self.negative_ttl)
+                raise
+            self._store(key, result, self.ttl)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def prime(self, host, port: int, address_info: list, ttl: int = None):
+        self._store(self._key(host, port), address_info, self.ttl if ttl is None else ttl)
+
+    def family(self, host):
+        '''
+        The address family the last connection to host succeeded with, or None.
+        '''
+        return self._families.get(self._key(host, 0)[0])
+
+    def remember_family(self, host, family):
+        host = self._key(host, 0)[0]
+        with self._lock:
+            if host not in self._families and len(self._families) >= self.max_size:
+                self._families.pop(next(iter(self._families)))
+            self._families[host] = family
+
+    def flush(self, host=None):
+        host = None if host is None else self._key(host, 0)[0]
+        with self._lock:
+            for name in list(self._families):
+                if host is None or name == host:
+                    del self._families[name]
+            for key in list(self._order):
+                if host is None or key[0] == host:
+                    del self._entries[key]
+                    self._order.remove(key)
+
+
+dns_cache = DnsCache()
+
+
+def _interleave(address_infos: list, family=None) -> list:
+    '''
+    Orders addresses as RFC 8305 asks: one of the preferred family first, then alternating families. Without a
+    preferred family the resolver's first answer decides.
+    '''
+    first = address_infos[0][0] if family is None else family
+    preferred = [address_info for address_info in address_infos if address_info[0] == first]
+    others = [address_info for address_info in address_infos if address_info[0] != first]
+    ordered = []
+    for index in range(max(len(preferred), len(others))):
+        ordered += preferred[index:index + 1] + others[index:index + 1]
+    return ordered
+
+
+class TlsCache:
+    '''
+    TLS contexts and sessions kept per host, so repeated HTTPS connections resume the previous session instead of
+    running a full handshake.
+
+    A session is stored when its connection closes and expires after ``session_lifetime`` seconds, or sooner if the
+    server asks for it. MicroPython does not expose sessions, there only the contexts are reused.
+    '''
+
+    def __init__(self, session_lifetime: int = 3600, max_hosts: int = 8):
+        self.session_lifetime = session_lifetime
+        self.max_hosts = max_hosts
+        self._contexts = {}
+        self._sessions = {}
+        self._lock = allocate_lock()
+
+    @staticmethod
+    def _key(host):
+        return host.encode(ENCODING) if isinstance(host, str) else host
+
+    def _make_room(self, entries: dict, key):
+        if key not in entries and len(entries) >= self.max_hosts:
+            del entries[next(iter(entries))]
+
+    def context(self, host):
+        key = self._key(host)
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is None:
+                self._make_room(self._contexts, key)
+                context = self._contexts[key] = _tls_context()
+            return context
+
+    def set_context(self, host, context):
+        '''Use context, e.g. one trusting a private CA, for every connection to host.'''
+        key = self._key(host)
+        with self._lock:
+            self._make_room(self._contexts, key)
+            self._contexts[key] = context
+            self._sessions.pop(key, None)  # Sessions only resume with the context that created them
+
+    def session(self, host):
+        key = self._key(host)
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            expires_at, session = entry
+            if ticks_diff(expires_at, ticks_ms()) <= 0:
+                del self._sessions[key]
+                return None
+            return session
+
+    def store(self, host, tls_sock):
+        session = getattr(tls_sock, 'session', None)
+        if session is None:
+            return
+        key = self._key(host)
+        lifetime = min(self.session_lifetime, getattr(session, 'timeout', self.session_lifetime))
+        with self._lock:
+            self._make_room(self._sessions, key)
+            self._sessions[key] = (ticks_ms() + lifetime * 1000, session)
+
+    def wrap(self, sock, host):
+        return _tls_wrap(self.context(host), sock, host, session=self.session(host))
+
+    def clear(self):
+        with self._lock:
+            self._contexts = {}
+            self._sessions = {}
+
+
+tls_cache = TlsCache()
+
+
+class ConnectionPool:
+    '''
+    Idle keep-alive connections grouped by (scheme, host, port).
+
+    At most ``max_idle`` connections are kept per key, and connections left idle for longer than ``idle_timeout``
+    seconds are closed instead of being handed out again.
+    '''
+
+    def __init__(self, max_idle: int = 2, idle_timeout: int = 30):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = allocate_lock()
+
+    def acquire(self, key):
+        while True:
+            with self._lock:
+                connections = self._idle.get(key)
+                if not connections:
+                    return None
+                sock, released_at = connections.pop()
+            if ticks_diff(ticks_ms(), released_at) < self.idle_timeout * 1000:
+                return sock
+            sock.close()
+
+    def release(self, key, sock):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            evicted = connections.pop(0)[0] if len(connections) >= self.max_idle else None
+            connections.append((sock, ticks_ms()))
+        if evicted is not None:
+            evicted.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for sock, _ in connections:
+                sock.close()
+
+
+IDEMPOTENT_METHODS = (b'GET', b'HEAD', b'PUT', b'DELETE', b'OPTIONS', b'TRACE')
 
 
 class HttpRequest:
     def __init__(self, url: str, port: int = None, method: str = 'GET', custom_headers: dict = None,
-                 body: HttpBody = None, save_to_file: str = None):
+                 body: HttpBody = None, save_to_file: str = None, session=None, stream: bool = False, into=None,
+                 send: bool = True, decompress: bool = False):
+        self.timings = Timings()
         self._proto, _dummy, self._host, self._path = self.url_parse(url)
         self._host, self._port = self._parse_port(self._host, self._proto) if port is None else (self._host, port)
 
@@ -462,11 +1601,16 @@ class HttpRequest:
         self._proto, self._host, self._path, self._method = self._bulk_encode(self._proto, self._host, self._path,
                                                                               self._method)
         self._save_to_file = save_to_file
-        self.response = self.request()
+        self._session = session
+        self._stream = stream
+        self._into = into
+        self._decompress = decompress
+        self._hooks = hooks if session is None or not session.hooks else hooks + session.hooks
+        self.response = self.request() if send else None
 
     @staticmethod
     def _bulk_encode(*args):
-        return map(lambda x: x.encode(ENCODING), args)
+        return [arg.encode(ENCODING) for arg in args]
 
     @staticmethod
     def _protocol_port_select(proto):
@@ -501,46 +1645,121 @@ class HttpRequest:
         sock.write(b'Host: %s\r\n' % self._host)
         self._send_custom_headers(sock)
         sock.write(b'User-Agent: MicroPython Client\r\n')
+        if self._decompress:
+            sock.write(b'Accept-Encoding: gzip, deflate\r\n')
+        if self._session is None:
+            sock.write(b'Connection: close\r\n')
 
-    def _create_socket(self):
-        self._host = b'127.0.0.1' if self._host == b'localhost' else self._host
-        address_info = usocket.getaddrinfo(self._host, self._port, 0, usocket.SOCK_STREAM)
-        if len(address_info) < 1:
-            raise ValueError('You are not connected to the internet...')
-        address_info = address_info[0]
-        # print(f'Address Info: {address_info}')
-        return usocket.socket(address_info[0], address_info[1], address_info[2]), address_info
+    def _mark(self, event: str):
+        setattr(self.timings, event, ticks_us())
+        if self._hooks:
+            _emit(self._hooks, event, self.timings)
 
-    def request(self):
+    def _create_socket(self):
+        address_infos = dns_cache.resolve(self._host, self._port)
+        self._mark('dns')
+        sock, address_info = _open_connection(_interleave(address_infos, dns_cache.family(self._host)),
+                                              SOCKET_TIMEOUT)
+        dns_cache.remember_family(self._host, address_info[0])
+        return sock, address_info
+
+    def _connect(self):
         sock, address_info = self._create_socket()
-        sock.settimeout(2)
-        print(f"Address Info: {address_info[-1]}")
-        sock.connect(address_info[-1])
-        if self._port == 443:
-            sock = ussl.wrap_socket(sock, server_hostname=self._host)
-        sock = SocketInterface(sock)
+        self._mark('connect')
+        if self._proto == b'https:':
+            host = self._host
+            sock = tls_cache.wrap(sock, host)
+            self._mark('tls')
+            return SocketInterface(sock, on_close=lambda tls_sock: tls_cache.store(host, tls_sock))
+        return SocketInterface(sock)
+
+    def write_to(self, sock, flush: bool = True):
+        sent_from = sock.bytes_sent
         self._send_headers(sock)
         self._body.send_body(sock)
-        gc.collect()
-        resp = HttpResponse(sock, save_to_file=self._save_to_file)
-        return resp
+        if flush:
+            sock.flush()
+        self.timings.bytes_sent = sock.bytes_sent - sent_from
+        self._mark('sent')
 
+    def read_response(self, sock, release=None):
+        self.response = HttpResponse(sock, save_to_file=self._save_to_file, release=release, stream=self._stream,
+                                     into=self._into, decompress=self._decompress, timings=self.timings,
+                                     hooks=self._hooks, head=self._method == b'HEAD')
+        return self.response
 
-def request(url: str, port: int = None, method: str = 'GET', data=None, json=None, file=None, custom_headers=None,
-            save_to_file: str = None, chunked=False, chunk_size=512):
+    def _exchange(self, sock, release=None):
+        self.write_to(sock)
+        return self.read_response(sock, release=release)
+
+    @property
+    def pool_key(self) -> tuple:
+        return self._proto, self._host, self._port
+
+    def _stale(self, e: OSError, sent: bool, responded: bool) -> bool:
+        '''
+        Whether a pooled connection failed the way one the server had already closed does, so the request can be
+        sent again on a new connection. Timeouts and failures after part of the response never qualify, the server
+        may have acted on the request. Other failures before the response only qualify for idempotent methods.
+        '''
+        if _timed_out(e) or responded:
+            return False
+        if not sent or isinstance(e, _NoResponse):
+            return True
+        return self._method in IDEMPOTENT_METHODS
+
+    def request(self):
+        # A prepared request may have waited in a queue, the clock starts when it is sent.
+        self.timings = Timings()
+        if self._session is None:
+            return self._exchange(self._connect())
+        pool, key = self._session.pool, self.pool_key
+        release = lambda sock: pool.release(key, sock)
+        sock = pool.acquire(key)
+        if sock is not None:
+            self.timings.reused = True
+            received = None
+            try:
+                self.write_to(sock)
+                received = sock.bytes_received
+                return self.read_response(sock, release=release)
+            except OSError as e:
+                sock.close()
+                if not self._stale(e, received is not None, received is not None and sock.bytes_received > received):
+                    raise
+                self.timings.reused = False
+        return self._exchange(self._connect(), release=release)
+
+
+def build_body(data=None, json=None, file=None, chunked=False, chunk_size=512, compress=None) -> HttpBody:
     if data is not None:
-        http_body = HttpBodyForm(form_data=data)
+        return HttpBodyForm(form_data=data, compress=compress)
     elif json is not None:
-        http_body = HttpBodyJSON(json_data=json)
+        if chunked:
+            return HttpBodyJSONStream(json_data=json, chunk_size=chunk_size, compress=compress)
+        return HttpBodyJSON(json_data=json, compress=compress)
     elif file is not None:
         if chunked:
-            http_body = HttpBodyChunked(file_name=file, chunk_size=chunk_size)
-        else:
-            http_body = HttpBodyFile(file_name=file)
-    else:
-        http_body = HttpBodyEmpty()
+            return HttpBodyChunked(file_name=file, chunk_size=chunk_size, compress=compress)
+        return HttpBodyFile(file_name=file, compress=compress)
+    return HttpBodyEmpty()
+
+
+def request(url: str, port: int = None, method: str = 'GET', data=None, json=None, file=None, custom_headers=None,
+            save_to_file: str = None, chunked=False, chunk_size=512, session=None, stream=False, into=None,
+            decompress=False, compress=None, cache=None):
+    '''
+    Sends a request and returns its HttpResponse. Pass an uhttp.cache.HttpCache as cache to serve GET requests from
+    disk while they are fresh and revalidate them once stale.
+    '''
+    if cache is not None and method == 'GET' and data is None and json is None and file is None and not stream \
+            and into is None and save_to_file is None:
+        send = lambda headers: request(url, port=port, custom_headers=headers, session=session, decompress=decompress)
+        return cache.fetch(url, send, custom_headers=custom_headers, decompress=decompress)
+    http_body = build_body(data=data, json=json, file=file, chunked=chunked, chunk_size=chunk_size, compress=compress)
     http_request = HttpRequest(url, port=port, custom_headers=custom_headers, method=method,
-                               save_to_file=save_to_file, body=http_body)
+                               save_to_file=save_to_file, body=http_body, session=session, stream=stream,
+                               into=into, decompress=decompress)
     return http_request.response
 
 
@@ -562,3 +1781,382 @@ def patch(url, **kw):
 
 def delete(url, **kw):
     return request(url, method='DELETE', **kw)
+
+
+SIDECAR_INTERVAL = 64 * 1024  # Bytes written between progress updates to the .part file
+
+
+def _read_sidecar(sidecar: str) -> (int, str):
+    try:
+        with open(sidecar) as reader:
+            offset, validator = reader.read().split('\n', 1)
+        return int(offset), validator.strip() or None
+    except (OSError, ValueError):
+        return 0, None
+
+
+def _write_sidecar(sidecar: str, offset: int, validator: str):
+    with open(sidecar, 'w') as writer:
+        writer.write('%d\n%s\n' % (offset, validator))
+
+
+def _remove_file(file_name: str):
+    try:
+        os.remove(file_name)
+    except OSError:
+        pass
+
+
+def _download_attempt(url: str, file_name: str, sidecar: str, port, custom_headers, session) -> HttpResponse:
+    offset, validator = _read_sidecar(sidecar)
+    try:
+        offset = min(offset, os.stat(file_name)[6])
+    except OSError:
+        offset = 0
+    headers = {} if custom_headers is None else dict(custom_headers)
+    if offset and validator is not None:
+        headers['Range'] = 'bytes=%d-' % offset
+        headers['If-Range'] = validator
+    r = request(url, port=port, custom_headers=headers, session=session, stream=True)
+    content_range = r.headers.get('Content-Range', '')
+    if r.status == 206 and 'Range' in headers and content_range.startswith('bytes %d-' % offset):
+        mode = 'r+b'
+    elif r.status == 200:
+        offset, mode = 0, 'wb'
+        validator = r.headers.get('ETag') or r.headers.get('Last-Modified')
+    elif r.status in (206, 416) and 'Range' in headers:
+        # The partial copy does not line up with what the server has, forget it and start over.
+        r.close()
+        _remove_file(sidecar)
+        return _download_attempt(url, file_name, sidecar, port, custom_headers, session)
+    else:
+        r.close()
+        return r
+    if validator is None:
+        # Without a validator a later Range request could splice two versions together, so there is no resuming.
+        _remove_file(sidecar)
+    else:
+        _write_sidecar(sidecar, offset, validator)
+    buff = buffer_pool.take(READ_BUFFER_SIZE)
+    view = memoryview(buff)
+    try:
+        with open(file_name, mode) as writer:
+            writer.seek(offset)
+            saved = offset
+            try:
+                while True:
+                    read = r.readinto(buff)
+                    if not read:
+                        break
+                    writer.write(view[:read])
+                    offset += read
+                    if validator is not None and offset - saved >= SIDECAR_INTERVAL:
+                        writer.flush()
+                        _write_sidecar(sidecar, offset, validator)
+                        saved = offset
+            except OSError:
+                if validator is not None:
+                    writer.flush()
+                    _write_sidecar(sidecar, offset, validator)
+                raise
+    finally:
+        # A dropped attempt must not keep its socket, or its buffers, until the next garbage collection.
+        r.close()
+        buffer_pool.give(buff)
+    _remove_file(sidecar)
+    return r
+
+
+def download(url: str, file_name: str, retries: int = 5, backoff: float = 1, max_backoff: float = 30, port=None,
+             custom_headers=None, session=None) -> HttpResponse:
+    '''
+    Saves the body at url to file_name and resumes after a dropped connection instead of starting over.
+
+    Progress and the ETag or Last-Modified validator are kept in file_name + '.part'. A retry, or a later call after
+    a reboot, asks for the rest with Range and If-Range. A 206 is written after the bytes already saved, a 200 means
+    the resource changed or ranges are not supported and the file is written from the start. Failed attempts and 5xx
+    responses are retried up to retries times, waiting backoff, 2 * backoff, 4 * backoff... seconds, at most
+    max_backoff. Returns the last response, its body is in the file.
+    '''
+    from time import sleep
+    sidecar = file_name + '.part'
+    attempt = 0
+    while True:
+        error = None
+        try:
+            r = _download_attempt(url, file_name, sidecar, port, custom_headers, session)
+            if r.status < 500:
+                return r
+        except OSError as e:
+            error = e
+        if attempt >= retries:
+            if error is not None:
+                raise error
+            return r
+        sleep(min(max_backoff, backoff * 2 ** attempt))
+        attempt += 1
+
+
+MIN_SEGMENT_SIZE = 256 * 1024  # Smaller ranges cost more in requests than they gain in throughput
+
+
+def _segment_ranges(r: HttpResponse, segments: int):
+    '''
+    Inclusive (start, end) byte ranges splitting the resource r describes, None if it cannot be fetched in ranges.
+    '''
+    size = r.headers.raw(b'content-length')
+    if r.status != 200 or size is None or b'bytes' not in (r.headers.raw(b'accept-ranges') or b'').lower():
+        return None
+    size = int(size)
+    segments = min(segments, size // MIN_SEGMENT_SIZE)
+    if segments < 2:
+        return None
+    step = -(-size // segments)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _preallocate(file_name: str, size: int):
+    with open(file_name, 'wb') as writer:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(writer.fileno(), 0, size)
+        else:
+            writer.seek(size - 1)
+            writer.write(b'\0')
+
+
+def _range_headers(custom_headers, start: int, end: int, validator: str) -> dict:
+    headers = {} if custom_headers is None else dict(custom_headers)
+    headers['Range'] = 'bytes=%d-%d' % (start, end)
+    if validator is not None:
+        # Should the resource change between segments, the server answers 200 instead of splicing two versions.
+        headers['If-Range'] = validator
+    return headers
+
+
+def _check_range(r: HttpResponse, start: int):
+    if r.status != 206 or not r.headers.get('Content-Range', '').startswith('bytes %d-' % start):
+        r.close()
+        raise OSError(f'Expected 206 for the range starting at {start}, got {r.status}. The resource may have changed.')
+
+
+def download_segmented(url: str, file_name: str, segments: int = 4, port=None, custom_headers=None,
+                       session=None) -> HttpResponse:
+    '''
+    Saves the body at url to file_name over several connections at once, each fetching its own byte range.
+
+    A HEAD request learns the size. When the server sends Accept-Ranges: bytes and the body is at least two
+    MIN_SEGMENT_SIZE long, the file is preallocated and every range is written at its offset as it arrives, with
+    pwrite, or mmap where there is no pwrite. Otherwise the body is saved by download() over a single stream.
+    Needs threading, so CPython only, see uhttp.aio.download_segmented for the cooperative variant.
+    Returns the HEAD response, or the response download() returned.
+    '''
+    head = request(url, port=port, method='HEAD', custom_headers=custom_headers, session=session)
+    ranges = _segment_ranges(head, segments)
+    if ranges is None:
+        return download(url, file_name, port=port, custom_headers=custom_headers, session=session)
+    import threading
+    size = ranges[-1][1] + 1
+    validator = head.headers.get('ETag') or head.headers.get('Last-Modified')
+    _preallocate(file_name, size)
+    fd = os.open(file_name, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    mapped = None
+    if hasattr(os, 'pwrite'):
+        def write_at(data, offset):
+            while data:
+                written = os.pwrite(fd, data, offset)
+                data, offset = data[written:], offset + written
+    else:
+        import mmap
+        mapped = mmap.mmap(fd, size)
+
+        def write_at(data, offset):
+            mapped[offset:offset + len(data)] = data
+    errors = []
+
+    def fetch(start, end):
+        try:
+            r = request(url, port=port, custom_headers=_range_headers(custom_headers, start, end, validator),
+                        session=session, stream=True)
+            _check_range(r, start)
+            offset = start
+
+            def write(data):
+                nonlocal offset
+                write_at(data, offset)
+                offset += len(data)
+
+            try:
+                _pump(r.readinto, write)
+            finally:
+                r.close()
+            if offset != end + 1:
+                raise OSError(f'Range {start}-{end} ended after {offset - start} bytes.')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch, args=span, daemon=True) for span in ranges]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if mapped is not None:
+            mapped.close()
+        os.close(fd)
+    if errors:
+        raise errors[0]
+    return head
+
+
+def map_requests(http_requests: list, workers: int = 4, per_host: int = 2) -> list:
+    '''
+    Sends prepared requests (HttpRequest(..., send=False) or Session.prepare()) from a pool of worker threads and
+    returns their responses in the same order. A request that raised has its exception in its place instead.
+
+    At most per_host requests run against one (scheme, host, port) at a time, the workers move on to other hosts
+    meanwhile. Requests prepared on a Session share its connection pool, give it max_idle=per_host to keep every
+    connection. Needs threading, so CPython only.
+    '''
+    import threading
+    results = [None] * len(http_requests)
+    pending = list(range(len(http_requests)))
+    active = {}
+    condition = threading.Condition()
+
+    def take():
+        with condition:
+            while pending:
+                for position, index in enumerate(pending):
+                    key = http_requests[index].pool_key
+                    if active.get(key, 0) < per_host:
+                        del pending[position]
+                        active[key] = active.get(key, 0) + 1
+                        return index, key
+                condition.wait()
+            return None, None
+
+    def work():
+        while True:
+            index, key = take()
+            if index is None:
+                return
+            try:
+                results[index] = http_requests[index].request()
+            except Exception as e:
+                results[index] = e
+            finally:
+                with condition:
+                    active[key] -= 1
+                    condition.notify_all()
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(min(workers, len(http_requests)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class Session:
+    '''
+    Keeps HTTP/1.1 connections alive between requests to the same (scheme, host, port).
+
+    Example:
+        with Session() as session:
+            r = session.post(url, json={'temperature': 21.5})
+    '''
+
+    def __init__(self, max_idle: int = 2, idle_timeout: int = 30, hooks: list = None, cache=None):
+        self.pool = ConnectionPool(max_idle=max_idle, idle_timeout=idle_timeout)
+        # Called like the module level hooks, for requests made through this session only.
+        self.hooks = [] if hooks is None else hooks
+        self.cache = cache
+
+    def request(self, url: str, **kw):
+        if self.cache is not None:
+            kw.setdefault('cache', self.cache)
+        return request(url, session=self, **kw)
+
+    def prepare(self, url: str, port: int = None, method: str = 'GET', data=None, json=None, file=None,
+                custom_headers=None, save_to_file: str = None, chunked=False, chunk_size=512, into=None,
+                decompress=False, compress=None):
+        '''
+        Builds a request bound to this session without sending it, for use with pipeline().
+        '''
+        http_body = build_body(data=data, json=json, file=file, chunked=chunked, chunk_size=chunk_size,
+                               compress=compress)
+        return HttpRequest(url, port=port, custom_headers=custom_headers, method=method, save_to_file=save_to_file,
+                           body=http_body, session=self, into=into, send=False, decompress=decompress)
+
+    def pipeline(self, http_requests: list):
+        '''
+        Sends prepared requests to one host over a single connection without waiting for each response, then
+        yields the responses in order as they are parsed.
+
+        If the server closes the connection before answering every request, the unanswered requests are sent again
+        one at a time. Servers may already have acted on a request whose response was lost, so only pipeline
+        requests that are safe to repeat.
+        '''
+        if not http_requests:
+            return
+        key = http_requests[0].pool_key
+        if any(http_request.pool_key != key for http_request in http_requests):
+            raise ValueError('Pipelined requests must all go to the same scheme, host and port.')
+        for http_request in http_requests:
+            http_request.timings = Timings()
+        sock = self.pool.acquire(key)
+        pooled = sock is not None
+        if not pooled:
+            sock = http_requests[0]._connect()
+        for index, http_request in enumerate(http_requests):
+            http_request.timings.reused = pooled or index > 0
+        answered = 0
+        try:
+            for http_request in http_requests:
+                http_request._stream = False  # Each response has to be read before the next one
+                http_request.write_to(sock, flush=False)
+            sock.flush()
+            kept = []
+            for index, http_request in enumerate(http_requests):
+                is_last = index == len(http_requests) - 1
+                release = (lambda conn: self.pool.release(key, conn)) if is_last else kept.append
+                response = http_request.read_response(sock, release=release)
+                answered += 1
+                yield response
+                if not is_last and not kept:
+                    break  # The server closed the connection after this response
+                kept.clear()
+        except OSError:
+            sock.close()
+        except GeneratorExit:
+            if answered < len(http_requests):
+                sock.close()  # Responses still in flight make the connection unusable
+            raise
+        for http_request in http_requests[answered:]:
+            http_request.timings = Timings()
+            yield http_request.request()
+
+    def get(self, url, **kw):
+        return self.request(url, method='GET', **kw)
+
+    def post(self, url, **kw):
+        return self.request(url, method='POST', **kw)
+
+    def put(self, url, **kw):
+        return self.request(url, method='PUT', **kw)
+
+    def patch(self, url, **kw):
+        return self.request(url, method='PATCH', **kw)
+
+    def delete(self, url, **kw):
+        return self.request(url, method='DELETE', **kw)
+
+    def close(self):
+        self.pool.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()